@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""
+batchframes.py
+Runs one of the animation effects over many svg files from the command
+line, several documents at a time.
+It is part of the Inkscape animation extension
+
+The effect options are the ones in the .inx dialogs, given after --:
+
+    python batchframes.py --effect hideframelayers --output normalized/ \\
+        'shots/*.svg' -- --fromframe=1 --toframe=999 --hpencil=true
+    python batchframes.py --effect outputframes --shells 4 shots/ \\
+        -- --directory=renders/ --image={name}-
+
+{name} in an effect option is replaced by the file name without its
+extension. Add --stream=true to the hideframelayers options to edit large
+documents without loading them whole.
+
+Each file is parsed and transformed in a worker process and the result
+is written to a temporary file renamed over the target, so an
+interrupted run never leaves half a document. outputframes renders
+through one render daemon shared by all the workers, --shells bounds
+the number of inkscape processes.
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, sys, glob, time, shutil, socket, optparse, tempfile, threading
+from multiprocessing import Pool, cpu_count
+import inkshell, renderdaemon
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# module, effect class and whether the effect changes the document
+EFFECTS = {
+    'hideframelayers': ('hideframelayers', 'HideLockSublayers', True),
+    'importpenciltest': ('importpenciltest', 'ImportPenciltest', True),
+    'outputframes': ('outputframes', 'OutputFrames', False),
+    'tweenframes': ('tweenframes', 'TweenFrames', True),
+}
+
+# where inkscape keeps inkex and the modules the effects import with it
+EXTENSIONS = '/usr/share/inkscape/extensions'
+
+def find_files(patterns):
+    """The svg files named by patterns, directories stand for the svg
+    files in them. Each file is listed once, in order."""
+    files = []
+    for pattern in patterns:
+        pattern = os.path.expanduser(pattern)
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.svg')
+        for path in sorted(glob.glob(pattern)):
+            if os.path.isfile(path) and path not in files:
+                files.append(path)
+    return files
+
+def write_atomic(write, target, source):
+    # write(file) fills a temporary file next to the target so the rename
+    # stays on one file system, with the permissions of the source document
+    handle, tmp = tempfile.mkstemp(suffix='.svg', prefix='.batchframes',
+        dir=os.path.dirname(os.path.abspath(target)))
+    f = os.fdopen(handle, 'wb')
+    try:
+        try:
+            write(f)
+        finally:
+            f.close()
+        shutil.copymode(source, tmp)
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            # windows will not rename over an existing file
+            os.remove(target)
+            os.rename(tmp, target)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def run_effect(task):
+    """Apply an effect to one file in a worker process. Returns a summary
+    of how it went, messages the effect printed are collected in it."""
+    name, args, path, output = task
+    module, classname, writes = EFFECTS[name]
+    summary = {'file': path, 'ok': False, 'error': None, 'output': None, 'messages': ''}
+    started = time.time()
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+        try:
+            effect = getattr(__import__(module), classname)()
+            basename = os.path.splitext(os.path.basename(path))[0]
+            args = [arg.replace('{name}', basename) for arg in args]
+            effect.getoptions(args + [path])
+            if getattr(effect.options, 'stream', False):
+                # the effect edits the document while copying it
+                write = lambda f: effect.streamframes(path, f)
+            else:
+                effect.affect(args + [path], False)
+                write = effect.document.write
+            if writes:
+                target = path
+                if output:
+                    target = os.path.join(output, os.path.basename(path))
+                write_atomic(write, target, path)
+                summary['output'] = target
+            summary['ok'] = True
+        except SystemExit:
+            # inkex exits when a document does not parse
+            summary['error'] = 'the effect stopped'
+        except Exception as e:
+            summary['error'] = '%s: %s' % (e.__class__.__name__, e)
+    finally:
+        summary['messages'] = sys.stderr.getvalue()
+        sys.stderr = stderr
+    summary['seconds'] = time.time() - started
+    return summary
+
+def start_daemon(shells, inkscape):
+    """A render daemon in a thread of this process on a private socket,
+    or (None, None) when unix sockets are not available."""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None, None
+    path = os.path.join(tempfile.mkdtemp(prefix='batchframes'), 'render.sock')
+    daemon = renderdaemon.RenderDaemon(path, shells, None, inkscape)
+    thread = threading.Thread(target=daemon.run)
+    thread.daemon = True
+    thread.start()
+    # the socket is bound before the shells start
+    for i in range(100):
+        if os.path.exists(path) or not thread.is_alive():
+            break
+        time.sleep(0.05)
+    return daemon, thread
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage='usage: %prog [options] svg files, directories or globs [-- effect options]')
+    parser.add_option('--effect', action='store', type='choice',
+        choices=sorted(EFFECTS), dest='effect', default=None,
+        help='Effect to apply: %s' % (', '.join(sorted(EFFECTS))))
+    parser.add_option('--output', action='store', type='string',
+        dest='output', default='',
+        help='Directory to write the changed documents to, they are replaced by default')
+    parser.add_option('--jobs', action='store', type='int',
+        dest='jobs', default=0,
+        help='Documents processed at a time, 0 for one per CPU')
+    parser.add_option('--shells', action='store', type='int',
+        dest='shells', default=0,
+        help='Inkscape processes shared by every document for rendering, 0 for one per CPU')
+    parser.add_option('--inkscape', action='store', type='string',
+        dest='inkscape', default=inkshell.INKSCAPE,
+        help='Inkscape executable')
+    parser.add_option('--extensions', action='store', type='string',
+        dest='extensions', default=EXTENSIONS,
+        help='Directory of the inkscape extensions with inkex.py')
+    effectargs = []
+    if '--' in argv:
+        effectargs = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    options, patterns = parser.parse_args(argv)
+    if options.effect is None:
+        parser.error('choose an effect with --effect')
+    files = find_files(patterns)
+    if not files:
+        parser.error('no svg files found')
+    if options.output and not os.path.isdir(options.output):
+        os.makedirs(options.output)
+    jobs = options.jobs
+    if jobs < 1:
+        jobs = cpu_count()
+    shells = options.shells
+    if shells < 1:
+        shells = cpu_count()
+
+    # the effects import inkex before they add the extensions directory
+    extensions = os.path.expanduser(options.extensions)
+    if extensions not in sys.path:
+        sys.path.append(extensions)
+    # fork the workers before the render daemon starts its threads
+    pool = Pool(min(jobs, len(files)))
+    daemon = thread = None
+    if options.effect == 'outputframes':
+        daemon, thread = start_daemon(shells, options.inkscape)
+        if daemon is not None:
+            effectargs = ['--daemon=true', '--socket=%s' % (daemon.path)] + effectargs
+    tasks = [(options.effect, effectargs, path, options.output) for path in files]
+    started = time.time()
+    failed = 0
+    try:
+        for summary in pool.imap_unordered(run_effect, tasks):
+            status = 'ok'
+            if not summary['ok']:
+                status = 'FAILED'
+                failed += 1
+            line = '%-6s %s %.2fs' % (status, summary['file'], summary['seconds'])
+            if summary['output'] and summary['output'] != summary['file']:
+                line += ' -> %s' % (summary['output'])
+            if summary['error']:
+                line += ' (%s)' % (summary['error'])
+            sys.stdout.write(line + '\n')
+            for message in summary['messages'].splitlines():
+                sys.stdout.write('    %s\n' % (message))
+            sys.stdout.flush()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if daemon is not None:
+            daemon.stop()
+            thread.join()
+            os.rmdir(os.path.dirname(daemon.path))
+    sys.stdout.write('%d files, %d failed, %.1fs\n' % (len(files), failed, time.time() - started))
+    return failed and 1 or 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+effectbench.py
+Times the animation effects on synthetic documents and measures their
+peak memory, to catch performance regressions between commits.
+It is part of the Inkscape animation extension
+
+    python benchmarks/effectbench.py --frames 10,100,1000 --ink 10,100 \\
+        --imagekb 0,64 --json before.json
+    python benchmarks/effectbench.py ... --json after.json --compare before.json
+
+Create/Import Frames (importpenciltest) makes the frames of a blank
+document, importing and embedding pencil images when imagekb is set.
+Set Frame Options (hideframelayers) runs on the whole tree and streamed.
+The output extension (outputframes) exports every frame through a fake
+inkscape --shell that only writes a 1x1 PNG, so its time is the document
+work around the rendering, 'export' is the part spent waiting for the
+shells. The incremental variant times a second export with nothing
+changed. The range variants of both run on the first --range frames
+only, against the whole document variants they show how much of the
+'edit' time, the effect without parsing and writing the document,
+follows the frames selected and how much the document size. What is
+left with a small range is the frame index, which visits every frame
+layer once, and for outputframes the copy of the document the shells
+read.
+
+Each run is a separate python process using the inkex stand-in in
+standin/, so the results do not depend on an inkscape install and the
+peak resident memory is the run's own.
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, sys, json, time, shutil, optparse, platform, resource, tempfile, subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+STANDIN = os.path.join(HERE, 'standin')
+sys.path.insert(0, HERE)
+import synthetic
+
+EFFECTS = ('importpenciltest', 'hideframelayers', 'outputframes')
+VARIANTS = {
+    'importpenciltest': ('chain', 'timeline'),
+    'hideframelayers': ('tree', 'stream', 'range'),
+    'outputframes': ('full', 'incremental', 'range'),
+}
+
+def peak_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+def apply(effect, args, timings):
+    # affect without the output, with the edit timed apart from the parse
+    effect.getoptions(args)
+    effect.svg_file = args[-1]
+    effect.parse()
+    started = time.time()
+    effect.effect()
+    timings['edit'] = time.time() - started
+
+def run_importpenciltest(variant, path, frames, workdir, out, timings):
+    import importpenciltest
+    args = ['--fromframe=1', '--toframe=%d' % (frames), '--preview=%s' % (variant)]
+    # the pencil images are written next to the blank document
+    pencil = os.path.join(os.path.dirname(path), 'pencil')
+    if os.path.isfile(pencil + '001.png'):
+        args += ['--importpencil=true', '--embedpencil=true', '--filename=%s' % (pencil),
+            '--filetype=.png']
+    effect = importpenciltest.ImportPenciltest()
+    apply(effect, args + [path], timings)
+    effect.document.write(out)
+
+def run_hideframelayers(variant, path, frames, workdir, out, timings):
+    import hideframelayers
+    args = ['--fromframe=1', '--toframe=%d' % (frames), '--duration=41.7', '--showframenum=true',
+        '--hpencil=true', '--lpaint=true', '--stream=%s' % (variant == 'stream'), path]
+    effect = hideframelayers.HideLockSublayers()
+    if variant == 'stream':
+        effect.getoptions(args)
+        effect.streamframes(path, out)
+    else:
+        apply(effect, args, timings)
+        effect.document.write(out)
+
+def run_outputframes(variant, path, frames, workdir, out, timings):
+    import inkshell, outputframes
+    export = inkshell.export
+    def timed(*args, **kwargs):
+        started = time.time()
+        try:
+            return export(*args, **kwargs)
+        finally:
+            timings['export'] = timings.get('export', 0.0) + time.time() - started
+    inkshell.export = timed
+    args = ['--directory=%s' % (os.path.join(workdir, 'frames', '')), '--image=frame',
+        '--fromframe=1', '--toframe=%d' % (frames), '--hpencil=true', '--daemon=false',
+        '--retries=0', '--incremental=%s' % (variant == 'incremental'), path]
+    effect = outputframes.OutputFrames()
+    apply(effect, args, timings)
+    effect.document.write(out)
+
+def child(effect, variant, path, frames, workdir):
+    # one measured run, the result is printed as json
+    sys.path.insert(0, STANDIN)
+    sys.path.insert(1, ROOT)
+    # imports are not part of the time
+    __import__(effect)
+    timings = {}
+    if effect == 'outputframes' and variant == 'incremental':
+        # the export being timed finds every frame unchanged
+        out = open(os.devnull, 'wb')
+        try:
+            run_outputframes('incremental', path, frames, workdir, out, {})
+        finally:
+            out.close()
+    basekb = peak_kb()
+    started = time.time()
+    out = open(os.devnull, 'wb')
+    try:
+        globals()['run_' + effect](variant, path, frames, workdir, out, timings)
+    finally:
+        out.close()
+    result = {'seconds': time.time() - started, 'peakkb': peak_kb(), 'basekb': basekb}
+    result.update(timings)
+    sys.stdout.write(json.dumps(result) + '\n')
+
+def fake_inkscape(bindir):
+    """A directory with an inkscape that runs fakeinkscape.py, to put
+    first on the PATH."""
+    os.makedirs(bindir)
+    script = os.path.join(bindir, 'inkscape')
+    f = open(script, 'w')
+    try:
+        f.write('#!/bin/sh\nexec "%s" "%s" "$@"\n' % (sys.executable, os.path.join(HERE, 'fakeinkscape.py')))
+    finally:
+        f.close()
+    os.chmod(script, 0o755)
+
+def measure(effect, variant, path, frames, workdir, env, repeat):
+    """Best time of repeat runs, each in its own process and work directory,
+    of the effect on frames 1 to frames."""
+    runs = []
+    for n in range(repeat):
+        rundir = os.path.join(workdir, 'run%d' % (n))
+        os.makedirs(os.path.join(rundir, 'frames'))
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+            '--child', '%s:%s' % (effect, variant), '--workdir', rundir, '--frames', str(frames),
+            path], env=env)
+        runs.append(json.loads(output.decode('ascii').splitlines()[-1]))
+        shutil.rmtree(rundir, ignore_errors=True)
+    best = min(runs, key=lambda run: run['seconds'])
+    best['peakkb'] = max(run['peakkb'] for run in runs)
+    best['runs'] = [round(run['seconds'], 4) for run in runs]
+    return best
+
+def case_key(case):
+    return (case['effect'], case['variant'], case['frames'], case['ink'], case['imagekb'])
+
+def commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            stderr=open(os.devnull, 'w'))
+        return output.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def numbers(value):
+    return [int(n) for n in value.split(',') if n.strip()]
+
+def main(args):
+    parser = optparse.OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--frames', action='store', type='string',
+        dest='frames', default='10,100,1000',
+        help='Comma separated frame counts, up to 9999')
+    parser.add_option('--ink', action='store', type='string',
+        dest='ink', default='10,100',
+        help='Comma separated numbers of ink paths in each frame')
+    parser.add_option('--imagekb', action='store', type='string',
+        dest='imagekb', default='0,64',
+        help='Comma separated sizes of the pencil image in each frame in kB, 0 for none')
+    parser.add_option('--range', action='store', type='int',
+        dest='range', default=10,
+        help='Frames selected by the range variants')
+    parser.add_option('--effects', action='store', type='string',
+        dest='effects', default=','.join(EFFECTS),
+        help='Comma separated effects to run')
+    parser.add_option('--repeat', action='store', type='int',
+        dest='repeat', default=1,
+        help='Runs of each case, the fastest is kept')
+    parser.add_option('--json', action='store', type='string',
+        dest='json', default='',
+        help='Write the results to this file')
+    parser.add_option('--compare', action='store', type='string',
+        dest='compare', default='',
+        help='Results of an earlier run to compare with')
+    parser.add_option('--child', action='store', type='string',
+        dest='child', default='',
+        help=optparse.SUPPRESS_HELP)
+    parser.add_option('--workdir', action='store', type='string',
+        dest='workdir', default='',
+        help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args(args)
+    if options.child:
+        effect, variant = options.child.split(':')
+        child(effect, variant, args[0], int(options.frames), options.workdir)
+        return 0
+    effects = [effect for effect in options.effects.split(',') if effect]
+    for effect in effects:
+        if effect not in EFFECTS:
+            parser.error('unknown effect %s' % (effect))
+    if max(numbers(options.frames)) > 9999:
+        parser.error('frame numbers stop at 9999')
+    baseline = {}
+    if options.compare:
+        f = open(options.compare)
+        try:
+            baseline = dict((case_key(case), case) for case in json.load(f)['cases'])
+        finally:
+            f.close()
+
+    tmpdir = tempfile.mkdtemp(prefix='effectbench')
+    env = dict(os.environ)
+    fake_inkscape(os.path.join(tmpdir, 'bin'))
+    env['PATH'] = os.path.join(tmpdir, 'bin') + os.pathsep + env.get('PATH', '')
+    cases = []
+    heading = '%-16s %-11s %6s %8s %5s %7s %8s %9s %8s %8s %9s' % ('effect', 'variant', 'frames',
+        'selected', 'ink', 'imagekb', 'MB', 'seconds', 'edit', 'export', 'peak MB')
+    if baseline:
+        heading += ' %8s %8s' % ('time x', 'peak x')
+    sys.stdout.write(heading + '\n')
+    try:
+        for frames in numbers(options.frames):
+            for imagekb in numbers(options.imagekb):
+                for ink in numbers(options.ink):
+                    path = os.path.join(tmpdir, 'frames%d-ink%d-%dkb.svg' % (frames, ink, imagekb))
+                    todo = []
+                    if 'importpenciltest' in effects and ink == numbers(options.ink)[0]:
+                        # the frames are made from a blank document, ink does not apply
+                        todo.append(('importpenciltest', None))
+                    for effect in ('hideframelayers', 'outputframes'):
+                        if effect in effects:
+                            todo.append((effect, ink))
+                    for effect, caseink in todo:
+                        workdir = tempfile.mkdtemp(dir=tmpdir)
+                        if effect == 'importpenciltest':
+                            source = os.path.join(workdir, 'blank.svg')
+                            synthetic.write_blank(source)
+                            if imagekb:
+                                synthetic.write_pencil_files(os.path.join(workdir, 'pencil'), frames,
+                                    imagekb)
+                        else:
+                            source = path
+                            if not os.path.isfile(path):
+                                synthetic.write_document(path, frames, ink, imagekb)
+                        for variant in VARIANTS[effect]:
+                            selected = frames
+                            if variant == 'range':
+                                selected = min(options.range, frames)
+                            case = {'effect': effect, 'variant': variant, 'frames': frames,
+                                'selected': selected, 'ink': caseink, 'imagekb': imagekb,
+                                'bytes': os.path.getsize(source)}
+                            case.update(measure(effect, variant, source, selected, workdir, env,
+                                options.repeat))
+                            cases.append(case)
+                            line = '%-16s %-11s %6d %8d %5s %7d %8.1f %9.3f %8s %8s %9.1f' % (effect,
+                                variant, frames, selected, caseink is None and '-' or caseink, imagekb,
+                                case['bytes'] / 1048576.0, case['seconds'],
+                                'edit' in case and '%.3f' % (case['edit']) or '-',
+                                'export' in case and '%.3f' % (case['export']) or '-',
+                                case['peakkb'] / 1024.0)
+                            old = baseline.get(case_key(case))
+                            if old is not None:
+                                line += ' %8.2f %8.2f' % (case['seconds'] / max(old['seconds'], 1e-6),
+                                    case['peakkb'] / float(max(old['peakkb'], 1)))
+                            sys.stdout.write(line + '\n')
+                            sys.stdout.flush()
+                        shutil.rmtree(workdir, ignore_errors=True)
+                    if os.path.isfile(path):
+                        os.remove(path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    if options.json:
+        f = open(options.json, 'w')
+        try:
+            json.dump({'commit': commit(), 'python': platform.python_version(),
+                'platform': platform.platform(), 'repeat': options.repeat, 'cases': cases},
+                f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+fakeinkscape.py
+Answers like 'inkscape --shell' without rendering, so the benchmarks time
+the extensions and not inkscape. Each export writes a 1x1 PNG and prints
+the lines inkshell.py follows.
+It is part of the Inkscape animation extension
+
+    FAKEINKSCAPE_MS=20 python benchmarks/fakeinkscape.py --shell
+
+FAKEINKSCAPE_MS is a pretend render time for each export in milliseconds.
+Exports whose file name contains one of the comma separated names in
+FAKEINKSCAPE_FAIL print an error and write nothing, like an id inkscape
+cannot find. Before an export whose file name contains one of the names
+in FAKEINKSCAPE_CRASH the shell exits with status 1. With a
+FAKEINKSCAPE_STATE directory it crashes only the first time for each
+name, so an export that is tried again succeeds.
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, sys, time, base64
+
+# a 1x1 transparent PNG
+PNG = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
+
+def argument(args, flag):
+    if flag in args and args.index(flag) + 1 < len(args):
+        return args[args.index(flag) + 1]
+    return None
+
+def names(variable):
+    return [name for name in os.environ.get(variable, '').split(',') if name]
+
+def crash(filename, statedir):
+    """Whether to exit before exporting filename."""
+    for name in names('FAKEINKSCAPE_CRASH'):
+        if name not in filename:
+            continue
+        if not statedir:
+            return True
+        marker = os.path.join(statedir, 'crashed-' + name)
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            return True
+    return False
+
+def main(args):
+    if '--shell' not in args:
+        sys.stderr.write('only --shell is supported\n')
+        return 1
+    delay = float(os.environ.get('FAKEINKSCAPE_MS', '0')) / 1000.0
+    statedir = os.environ.get('FAKEINKSCAPE_STATE')
+    sys.stdout.write("Inkscape 0.48 interactive shell mode. Type 'quit' to quit.\n>")
+    sys.stdout.flush()
+    while True:
+        line = sys.stdin.readline()
+        if not line or line.strip() == 'quit':
+            break
+        filename = argument(line.split(), '-e')
+        if filename is not None and crash(filename, statedir):
+            sys.stdout.flush()
+            os._exit(1)
+        if filename is not None and [name for name in names('FAKEINKSCAPE_FAIL') if name in filename]:
+            sys.stderr.write('Object with id="%s" was not found in the document.\n' % (
+                argument(line.split(), '-i')))
+            sys.stderr.flush()
+        elif filename is not None:
+            if delay:
+                time.sleep(delay)
+            f = open(filename, 'wb')
+            try:
+                f.write(PNG)
+            finally:
+                f.close()
+            sys.stdout.write('Background RRGGBBAA: ffffff00\n'
+                'Area 0:0:1:1 exported to 1 x 1 pixels (90 dpi)\n'
+                'Bitmap saved as: %s\n' % (filename))
+        sys.stdout.write('>')
+        sys.stdout.flush()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
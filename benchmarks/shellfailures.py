@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""
+shellfailures.py
+Checks that frame exports survive inkscape shells that crash or fail a
+frame part way through their shard: the frames are exported again up to
+the retries, what still fails is reported as failed and the rest of the
+shards are not held up. Then the same through renderdaemon.py: a daemon
+that renders every frame, one killed part way through whose frames the
+local shells finish, and one that exits by itself when idle.
+It is part of the Inkscape animation extension
+
+    python benchmarks/shellfailures.py
+
+The shells are fakeinkscape.py told which frames to crash or fail on.
+Prints a line for each case and exits with status 1 when one fails.
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, sys, time, shutil, signal, optparse, tempfile, threading, subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+import inkshell, framereport
+from inkshell import ExportJob
+from effectbench import fake_inkscape
+
+ROOT = os.path.dirname(HERE)
+
+# frames 1, 3, 5, 7 go to the first of two shells and 2, 4, 6, 8 to the second
+FRAMES = 8
+WORKERS = 2
+
+# name, how the shells misbehave, retries, whether to use export_iter
+# and for each frame the (ok, attempts) expected after the export
+CASES = [
+    ('crash mid-shard, retried', {'FAKEINKSCAPE_CRASH': 'frame005'}, 1, False,
+        {5: (True, 2), 7: (True, 2)}),
+    ('crash mid-shard, no retries', {'FAKEINKSCAPE_CRASH': 'frame005'}, 0, False,
+        {5: (False, 1), 7: (False, 1)}),
+    ('crash in every attempt', {'FAKEINKSCAPE_CRASH': 'frame005', 'FAKEINKSCAPE_STATE': None}, 2, False,
+        {5: (False, 3), 7: (True, 2)}),
+    ('frame error mid-shard, retried', {'FAKEINKSCAPE_FAIL': 'frame004'}, 1, False,
+        {4: (False, 2)}),
+    ('crash mid-shard, in order, retried', {'FAKEINKSCAPE_CRASH': 'frame003'}, 1, True,
+        {3: (True, 2), 5: (True, 2), 7: (True, 2)}),
+    ('frame error mid-shard, in order', {'FAKEINKSCAPE_FAIL': 'frame006'}, 0, True,
+        {6: (False, 1)}),
+]
+
+class Quiet(object):
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+def make_jobs(workdir):
+    jobs = []
+    for framenum in range(1, FRAMES + 1):
+        filename = os.path.join(workdir, 'frame%03d.png' % (framenum))
+        jobs.append(ExportJob(framenum, '%03d' % (framenum), 'f%03d' % (framenum), filename,
+            inkshell.export_command('drawing.svg', 'f%03d' % (framenum), filename)))
+    return jobs
+
+def check_progress(jobs, progress):
+    problems = []
+    failed = set(id(job) for job in jobs if not job.ok)
+    if progress.failed != failed:
+        problems.append('progress has %d failed frames, expected %d' % (len(progress.failed),
+            len(failed)))
+    if progress.count != FRAMES - len(failed):
+        problems.append('progress counted %d saved frames, expected %d' % (progress.count,
+            FRAMES - len(failed)))
+    return problems
+
+def check(workdir, inkscape, behaviour, retries, inorder, expected):
+    """Run one case, returns what went wrong or an empty list."""
+    statedir = os.path.join(workdir, 'state')
+    os.makedirs(statedir)
+    env = {'FAKEINKSCAPE_STATE': statedir}
+    env.update(behaviour)
+    saved = dict((name, os.environ.get(name)) for name in env)
+    for name, value in env.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    jobs = make_jobs(workdir)
+    progress = framereport.Progress(len(jobs), Quiet())
+    problems = []
+    try:
+        if inorder:
+            order = [job.framenum for job in inkshell.export_iter(jobs, WORKERS, inkscape,
+                retries=retries, progress=progress)]
+            if order != list(range(1, FRAMES + 1)):
+                problems.append('frames came out as %s' % (order))
+        else:
+            inkshell.export(jobs, WORKERS, inkscape, retries=retries, progress=progress)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    for job in jobs:
+        ok, attempts = expected.get(job.framenum, (True, 1))
+        if (job.ok, job.attempts) != (ok, attempts):
+            problems.append('%s ok:%s attempts:%d, expected ok:%s attempts:%d' % (job.idattr,
+                job.ok, job.attempts, ok, attempts))
+        if not job.ok and not job.error:
+            problems.append('%s failed without an error' % (job.idattr))
+        if job.ok != os.path.isfile(job.filename):
+            problems.append('%s ok:%s but the image is %s' % (job.idattr, job.ok,
+                job.ok and 'missing' or 'there'))
+    return problems + check_progress(jobs, progress)
+
+def start_daemon(workdir, inkscape, idle=600, delay=0):
+    """A renderdaemon.py process with two shells that render in delay
+    milliseconds, and its socket once it answers."""
+    path = os.path.join(workdir, 'render.sock')
+    env = dict(os.environ)
+    env['FAKEINKSCAPE_MS'] = str(delay)
+    daemon = subprocess.Popen([sys.executable, os.path.join(ROOT, 'renderdaemon.py'),
+        '--socket', path, '--idle', str(idle), '--shells', '2', '--inkscape', inkscape], env=env)
+    for i in range(100):
+        if inkshell.daemon_status(path) is not None or daemon.poll() is not None:
+            break
+        time.sleep(0.1)
+    return daemon, path
+
+def stop_daemon(daemon):
+    if daemon.poll() is None:
+        daemon.kill()
+    daemon.wait()
+
+def check_daemon(workdir, inkscape):
+    """Every frame is rendered by the daemon."""
+    daemon, path = start_daemon(workdir, inkscape)
+    try:
+        jobs = make_jobs(workdir)
+        progress = framereport.Progress(len(jobs), Quiet())
+        shells = inkshell.export(jobs, WORKERS, inkscape, daemon=path, progress=progress)
+        status = inkshell.daemon_status(path)
+    finally:
+        stop_daemon(daemon)
+    problems = ['%s failed: %s' % (job.idattr, job.error) for job in jobs if not job.ok]
+    if len(shells) != WORKERS:
+        problems.append('%d connections to the daemon, expected %d' % (len(shells), WORKERS))
+    if status is None or status['done'] != FRAMES:
+        problems.append('the daemon reports %s' % (status))
+    return problems + check_progress(jobs, progress)
+
+def check_daemon_killed(workdir, inkscape):
+    """The daemon is killed part way through, the local shells export the
+    frames it did not."""
+    daemon, path = start_daemon(workdir, inkscape, delay=200)
+    jobs = make_jobs(workdir)
+    saved = []
+    def kill():
+        saved.append(len([job for job in jobs if os.path.isfile(job.filename)]))
+        daemon.send_signal(signal.SIGKILL)
+    killer = threading.Timer(0.5, kill)
+    try:
+        progress = framereport.Progress(len(jobs), Quiet())
+        killer.start()
+        inkshell.export(jobs, WORKERS, inkscape, daemon=path, progress=progress)
+    finally:
+        killer.cancel()
+        stop_daemon(daemon)
+    problems = ['%s failed: %s' % (job.idattr, job.error) for job in jobs if not job.ok]
+    if not saved or not 0 < saved[0] < FRAMES:
+        problems.append('the daemon had saved %s frames when it was killed, expected some' % (
+            saved and saved[0]))
+    return problems + check_progress(jobs, progress)
+
+def check_daemon_idle(workdir, inkscape):
+    """The daemon answers status and exits after its idle time."""
+    daemon, path = start_daemon(workdir, inkscape, idle=1)
+    problems = []
+    try:
+        status = inkshell.daemon_status(path)
+        if status is None or status['shells'] != 2 or status['queue'] != 0:
+            problems.append('the daemon reports %s' % (status))
+        for i in range(50):
+            if daemon.poll() is not None:
+                break
+            time.sleep(0.1)
+        if daemon.poll() != 0:
+            problems.append('the idle daemon is still running or failed: %s' % (daemon.poll()))
+        if os.path.exists(path) or inkshell.daemon_status(path) is not None:
+            problems.append('the socket is still there')
+    finally:
+        stop_daemon(daemon)
+    return problems
+
+DAEMONCASES = [
+    ('daemon renders every frame', check_daemon),
+    ('daemon killed mid-run, local shells finish', check_daemon_killed),
+    ('idle daemon exits', check_daemon_idle),
+]
+
+def main(args):
+    parser = optparse.OptionParser(usage='usage: %prog')
+    options, args = parser.parse_args(args)
+    tmpdir = tempfile.mkdtemp(prefix='shellfailures')
+    failures = 0
+    try:
+        fake_inkscape(os.path.join(tmpdir, 'bin'))
+        inkscape = os.path.join(tmpdir, 'bin', 'inkscape')
+        cases = [(name, lambda workdir, case=case: check(workdir, inkscape, *case))
+            for name, case in [(case[0], case[1:]) for case in CASES]]
+        cases += [(name, lambda workdir, function=function: function(workdir, inkscape))
+            for name, function in DAEMONCASES]
+        for n, (name, run) in enumerate(cases):
+            workdir = os.path.join(tmpdir, 'case%d' % (n))
+            os.makedirs(workdir)
+            problems = run(workdir)
+            sys.stdout.write('%-6s %s\n' % (problems and 'FAILED' or 'ok', name))
+            for problem in problems:
+                sys.stdout.write('    %s\n' % (problem))
+            failures += len(problems) and 1
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    sys.stdout.write('%d cases, %d failed\n' % (len(cases), failures))
+    return failures and 1 or 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+inkex.py
+A minimal stand-in for the inkex module inkscape ships, with just what
+the animation extensions use, so the benchmarks run without inkscape.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import sys, copy, optparse
+from lxml import etree
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+# the extensions are written for the python 2 inkscape 0.48 runs them with
+if not hasattr(builtins, 'long'):
+    builtins.long = int
+
+NSS = {
+    'sodipodi': 'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
+    'cc': 'http://creativecommons.org/ns#',
+    'ccOLD': 'http://web.resource.org/cc/',
+    'svg': 'http://www.w3.org/2000/svg',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'inkscape': 'http://www.inkscape.org/namespaces/inkscape',
+    'xlink': 'http://www.w3.org/1999/xlink',
+    'xml': 'http://www.w3.org/XML/1998/namespace'
+}
+
+def addNS(tag, ns=None):
+    val = tag
+    if ns is not None and len(ns) > 0 and ns in NSS and len(tag) > 0 and tag[0] != '{':
+        val = "{%s}%s" % (NSS[ns], tag)
+    return val
+
+def errormsg(msg):
+    sys.stderr.write(str(msg) + '\n')
+
+def check_inkbool(option, opt, value):
+    if str(value).capitalize() == 'True':
+        return True
+    elif str(value).capitalize() == 'False':
+        return False
+    else:
+        raise optparse.OptionValueError("option %s: invalid inkbool value: %s" % (opt, value))
+
+class InkOption(optparse.Option):
+    TYPES = optparse.Option.TYPES + ("inkbool",)
+    TYPE_CHECKER = copy.copy(optparse.Option.TYPE_CHECKER)
+    TYPE_CHECKER["inkbool"] = check_inkbool
+
+class Effect(object):
+    """The parts of inkex.Effect the extensions use: options, the parsed
+    document and writing it out."""
+    def __init__(self, *args, **kwargs):
+        self.document = None
+        self.options = None
+        self.args = None
+        self.OptionParser = optparse.OptionParser(usage="usage: %prog [options] SVGfile",
+            option_class=InkOption)
+        self.OptionParser.add_option("--id", action="append", type="string",
+            dest="ids", default=[], help="id attribute of object to manipulate")
+
+    def effect(self):
+        pass
+
+    def getoptions(self, args=sys.argv[1:]):
+        self.options, self.args = self.OptionParser.parse_args(args)
+
+    def parse(self, filename=None):
+        if filename is None:
+            filename = self.svg_file
+        parser = etree.XMLParser(huge_tree=True)
+        self.document = etree.parse(filename, parser=parser)
+
+    def output(self):
+        self.document.write(getattr(sys.stdout, 'buffer', sys.stdout))
+
+    def xpathSingle(self, path):
+        try:
+            retval = self.document.xpath(path, namespaces=NSS)[0]
+        except IndexError:
+            errormsg("No matching node for expression: %s" % (path))
+            retval = None
+        return retval
+
+    def affect(self, args=sys.argv[1:], output=True):
+        self.svg_file = args[-1]
+        self.getoptions(args)
+        self.parse()
+        self.effect()
+        if output:
+            self.output()
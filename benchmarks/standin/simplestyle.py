@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""
+simplestyle.py
+A minimal stand-in for the simplestyle module inkscape ships, see
+inkex.py next to it.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+def parseStyle(s):
+    """Create a dictionary from the value of an inline style attribute"""
+    if s is None:
+        return {}
+    return dict([[x.strip() for x in i.split(":", 1)] for i in s.split(";") if len(i.strip())])
+
+def formatStyle(a):
+    """Format an inline style attribute from a dictionary"""
+    return ";".join([att + ":" + str(val) for att, val in a.items()])
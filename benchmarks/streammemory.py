@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+streammemory.py
+Peak memory of 'Set Frame Options' loading the whole document against
+streaming it, for synthetic.py documents with more and more embedded
+pencil images.
+It is part of the Inkscape animation extension
+
+    python benchmarks/streammemory.py --frames 25,50,100,200 --imagekb 256
+
+Each run is a separate python process so its peak resident memory is
+its own. With streaming the peak should stay flat as the document grows.
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, sys, json, time, shutil, optparse, resource, tempfile, subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+# the inkex stand-in, see effectbench.py
+sys.path.insert(0, os.path.join(HERE, 'standin'))
+sys.path.insert(0, HERE)
+import synthetic
+
+def peak_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+def child(mode, path):
+    # one measured run, the result is printed as json
+    import hideframelayers
+    args = ['--fromframe=1', '--toframe=999', '--hpencil=true', '--stream=%s' % (mode == 'stream'), path]
+    started = time.time()
+    out = open(os.devnull, 'wb')
+    try:
+        effect = hideframelayers.HideLockSublayers()
+        if mode == 'stream':
+            effect.getoptions(args)
+            effect.streamframes(path, out)
+        else:
+            effect.affect(args, False)
+            effect.document.write(out)
+    finally:
+        out.close()
+    sys.stdout.write(json.dumps({'seconds': time.time() - started, 'peakkb': peak_kb()}) + '\n')
+
+def main(args):
+    parser = optparse.OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--frames', action='store', type='string',
+        dest='frames', default='25,50,100,200',
+        help='Comma separated frame counts to measure')
+    parser.add_option('--imagekb', action='store', type='int',
+        dest='imagekb', default=256,
+        help='Size of the embedded image in each frame in kB')
+    parser.add_option('--json', action='store', type='string',
+        dest='json', default='',
+        help='Also write the results to this file')
+    parser.add_option('--child', action='store', type='string',
+        dest='child', default='',
+        help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args(args)
+    if options.child:
+        child(options.child, args[0])
+        return 0
+    tmpdir = tempfile.mkdtemp(prefix='streammemory')
+    results = []
+    try:
+        sys.stdout.write('%8s %10s %14s %14s %10s %10s\n' % ('frames', 'MB',
+            'tree peak MB', 'stream peak MB', 'tree s', 'stream s'))
+        for frames in [int(n) for n in options.frames.split(',')]:
+            path = os.path.join(tmpdir, 'frames%d.svg' % (frames))
+            synthetic.write_document(path, frames, ink=1, imagekb=options.imagekb)
+            result = {'frames': frames, 'bytes': os.path.getsize(path)}
+            for mode in ('tree', 'stream'):
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                    '--child', mode, path])
+                result[mode] = json.loads(output.decode('ascii').splitlines()[-1])
+            results.append(result)
+            sys.stdout.write('%8d %10.1f %14.1f %14.1f %10.2f %10.2f\n' % (frames,
+                result['bytes'] / 1048576.0, result['tree']['peakkb'] / 1024.0,
+                result['stream']['peakkb'] / 1024.0, result['tree']['seconds'],
+                result['stream']['seconds']))
+            os.remove(path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    if options.json:
+        f = open(options.json, 'w')
+        try:
+            json.dump({'imagekb': options.imagekb, 'results': results}, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+synthetic.py
+Writes animation documents in the frame layout importpenciltest.py
+creates, f### layers with bg###, pencil###, paint###, ink### and
+frametext### sublayers, with as many frames, ink paths and embedded
+pencil image data as a benchmark asks for.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, zlib, base64, random, struct
+
+WIDTH = 560
+HEIGHT = 316
+DURATION = 83.3
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink"
+   xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+   xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
+   width="%(width)d" height="%(height)d" viewBox="0 0 %(width)d %(height)d"
+   sodipodi:docname="%(docname)s">
+'''
+
+FRAME = '''  <g id="f%(frame)s" style="display:none" inkscape:label="f%(frame)s" inkscape:groupmode="layer">
+    <set id="init%(frame)s" attributeName="display" attributeType="CSS" to="none" begin="0ms; off%(last)s.end" dur="%(wait)sms"/>
+    <set id="on%(frame)s" attributeName="display" attributeType="CSS" to="inline" begin="init%(frame)s.end" dur="%(duration)sms"/>
+    <set id="off%(frame)s" attributeName="display" attributeType="CSS" to="none" begin="on%(frame)s.end" dur="%(rest)sms"/>
+    <g id="bg%(frame)s" inkscape:label="background" inkscape:groupmode="layer" sodipodi:insensitive="true">
+      <rect id="bgfill%(frame)s" width="%(width)d" height="%(height)d" style="fill:#FFFFFF"/>
+    </g>
+%(pencil)s    <g id="paint%(frame)s" inkscape:label="paint" inkscape:groupmode="layer">%(paint)s</g>
+    <g id="ink%(frame)s" inkscape:label="ink" inkscape:groupmode="layer">%(ink)s</g>
+    <text id="frametext%(frame)s" x="0" y="14" style="display:none;font-size:18px;fill:#000000;fill-opacity:0.3"><tspan id="tspan%(frame)s" x="0" y="14">%(frame)s</tspan></text>
+  </g>
+'''
+
+PENCIL = '''    <g id="pencil%(frame)s" style="opacity:0.4" inkscape:label="pencil" inkscape:groupmode="layer" sodipodi:insensitive="true">
+      <image id="pimage%(frame)s" xlink:href="%(href)s" width="%(width)d" height="%(height)d"/>
+    </g>
+'''
+
+def chunk(kind, data):
+    return (struct.pack('>I', len(data)) + kind + data +
+        struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+def png_bytes(kb, width=WIDTH, height=HEIGHT):
+    """A blank grayscale PNG of about kb kB. The size is made up by random
+    bytes in a private chunk, so no two images are alike and they do not
+    compress."""
+    rows = (b'\x00' + b'\xff' * width) * height
+    data = (b'\x89PNG\r\n\x1a\n' +
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) +
+        chunk(b'IDAT', zlib.compress(rows)))
+    padding = kb * 1024 - len(data) - 24
+    if padding > 0:
+        data += chunk(b'paDd', os.urandom(padding))
+    return data + chunk(b'IEND', b'')
+
+def write_pencil_files(base, frames, kb):
+    """Pencil test images base001.png ... for importpenciltest.py."""
+    for framenum in range(1, frames + 1):
+        f = open('%s%s.png' % (base, format(framenum, '03d')), 'wb')
+        try:
+            f.write(png_bytes(kb))
+        finally:
+            f.close()
+
+def ink_path(rand, idattr):
+    # a stroke of a few curves somewhere on the page
+    x = rand.uniform(0, WIDTH)
+    y = rand.uniform(0, HEIGHT)
+    curves = ' '.join('%.3f,%.3f %.3f,%.3f %.3f,%.3f' % tuple(rand.uniform(-20, 20) for i in range(6))
+        for n in range(6))
+    return ('<path id="%s" d="m %.3f,%.3f c %s" style="fill:none;stroke:#000000;stroke-width:1px"/>'
+        % (idattr, x, y, curves))
+
+def paint_path(rand, idattr):
+    x = rand.uniform(0, WIDTH)
+    y = rand.uniform(0, HEIGHT)
+    return ('<path id="%s" d="m %.3f,%.3f l %.3f,0 0,%.3f z" style="fill:#%06x;stroke:none"/>'
+        % (idattr, x, y, rand.uniform(5, 40), rand.uniform(5, 40), rand.randint(0, 0xffffff)))
+
+def write_blank(path):
+    """A document without frames for importpenciltest.py to fill."""
+    f = open(path, 'w')
+    try:
+        f.write(HEADER % {'width': WIDTH, 'height': HEIGHT, 'docname': os.path.basename(path)})
+        f.write('</svg>\n')
+    finally:
+        f.close()
+
+def write_document(path, frames, ink=10, imagekb=0, seed=0):
+    """A document of frames with ink paths in each ink sublayer, a fill
+    for every four of them in the paint sublayer and, with imagekb, a
+    pencil image of that size embedded in each frame."""
+    rand = random.Random(seed)
+    last = format(frames, '03d')
+    f = open(path, 'w')
+    try:
+        f.write(HEADER % {'width': WIDTH, 'height': HEIGHT, 'docname': os.path.basename(path)})
+        for framenum in range(1, frames + 1):
+            frame = format(framenum, '03d')
+            pencil = ''
+            if imagekb:
+                href = 'data:image/png;base64,' + base64.b64encode(png_bytes(imagekb)).decode('ascii')
+                pencil = PENCIL % {'frame': frame, 'href': href, 'width': WIDTH, 'height': HEIGHT}
+            f.write(FRAME % {'frame': frame, 'last': last, 'width': WIDTH, 'height': HEIGHT,
+                'duration': DURATION, 'wait': DURATION * (framenum - 1),
+                'rest': DURATION * (frames - framenum + 1) + 1, 'pencil': pencil,
+                'paint': ''.join(paint_path(rand, 'fill%s-%d' % (frame, n)) for n in range(ink // 4)),
+                'ink': ''.join(ink_path(rand, 'stroke%s-%d' % (frame, n)) for n in range(ink))})
+        f.write('</svg>\n')
+    finally:
+        f.close()
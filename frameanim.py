@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+"""
+frameanim.py
+Writers that encode exported frames straight into an animation file.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, json, shutil, struct, hashlib, tempfile, zlib
+
+try:
+    from PIL import Image, GifImagePlugin
+    bimage = True
+except:
+    bimage = False
+
+try:
+    import numpy
+    bnumpy = True
+except:
+    bnumpy = False
+
+PNGSIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# file extension for each animation format
+EXTENSIONS = {'apng': '.apng', 'gif': '.gif', 'y4m': '.y4m', 'atlas': '.json'}
+
+# the gif palette is chosen from a thumbnail of each frame no larger
+# than SAMPLESIZE, from at most MAXSAMPLES frames spread over the animation
+SAMPLESIZE = (128, 128)
+MAXSAMPLES = 256
+
+# transparent pixels left between atlas cells so they do not bleed
+# into each other when sampled
+PADDING = 1
+
+def read_chunks(filename):
+    """List the (type, data) chunks of a png file."""
+    f = open(filename, 'rb')
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    if data[:8] != PNGSIGNATURE:
+        raise ValueError('%s is not a png image' % (filename))
+    chunks = []
+    position = 8
+    while position + 8 <= len(data):
+        length, = struct.unpack('>I', data[position:position + 4])
+        chunktype = data[position + 4:position + 8]
+        chunks.append((chunktype, data[position + 8:position + 8 + length]))
+        position += 12 + length
+    return chunks
+
+def chunk(chunktype, data):
+    return (struct.pack('>I', len(data)) + chunktype + data +
+        struct.pack('>I', zlib.crc32(chunktype + data) & 0xFFFFFFFF))
+
+class ApngWriter(object):
+    """Builds an animated png by copying the compressed image data of each
+    exported frame, the frames are never decoded. All frames need the same
+    size and pixel format."""
+    def __init__(self, filename):
+        self.filename = filename
+        self.f = open(filename, 'wb')
+        self.ihdr = None
+        self.actl = None
+        self.frames = 0
+        self.sequence = 0
+
+    def add(self, filename, duration):
+        chunks = read_chunks(filename)
+        ihdr = [data for chunktype, data in chunks if chunktype == b'IHDR'][0]
+        if self.ihdr is None:
+            self.ihdr = ihdr
+            self.f.write(PNGSIGNATURE)
+            self.f.write(chunk(b'IHDR', ihdr))
+            # the frame count is rewritten on close
+            self.actl = self.f.tell()
+            self.f.write(chunk(b'acTL', struct.pack('>II', 0, 0)))
+            for chunktype, data in chunks:
+                if chunktype in (b'PLTE', b'tRNS', b'gAMA', b'sRGB', b'pHYs'):
+                    self.f.write(chunk(chunktype, data))
+        elif ihdr != self.ihdr:
+            raise ValueError('%s does not match the size or format of the first frame' % (filename))
+        width, height = struct.unpack('>II', ihdr[:8])
+        # delays are a fraction, tenths of a millisecond when they fit
+        delay, denominator = int(round(duration * 10)), 10000
+        if delay > 0xFFFF:
+            delay, denominator = min(int(round(duration)), 0xFFFF), 1000
+        self.f.write(chunk(b'fcTL', struct.pack('>IIIIIHHBB', self.sequence,
+            width, height, 0, 0, delay, denominator, 0, 0)))
+        self.sequence += 1
+        for chunktype, data in chunks:
+            if chunktype != b'IDAT':
+                continue
+            if self.frames == 0:
+                self.f.write(chunk(b'IDAT', data))
+            else:
+                self.f.write(chunk(b'fdAT', struct.pack('>I', self.sequence) + data))
+                self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        if self.ihdr is not None:
+            self.f.write(chunk(b'IEND', b''))
+            self.f.seek(self.actl)
+            self.f.write(chunk(b'acTL', struct.pack('>II', self.frames, 0)))
+        self.f.close()
+
+def flatten(filename, background=(255, 255, 255)):
+    # animations without alpha are shown over the page color
+    image = Image.open(filename).convert('RGBA')
+    flat = Image.new('RGB', image.size, background)
+    flat.paste(image, (0, 0), image)
+    return flat
+
+class GifWriter(object):
+    """Builds an animated gif. All frames share one palette chosen from a
+    sample of every frame, so colors do not flicker between frames and a
+    blank first frame does not take the colors from the rest. The frames
+    wait in a temporary directory with only a small thumbnail of each in
+    memory, on close the palette is chosen and they are encoded one at a
+    time."""
+    def __init__(self, filename):
+        self.filename = filename
+        # opened now so an unwritable file fails before the frames render
+        self.f = open(filename, 'wb')
+        self.tmpdir = tempfile.mkdtemp(prefix='gifwriter')
+        self.frames = []
+        self.samples = []
+        self.durations = []
+
+    def add(self, filename, duration):
+        sample = flatten(filename)
+        # nearest keeps the colors of the frame instead of blends of them
+        sample.thumbnail(SAMPLESIZE, Image.NEAREST)
+        self.frames.append(os.path.join(self.tmpdir, '%d.png' % (len(self.frames))))
+        shutil.copyfile(filename, self.frames[-1])
+        self.samples.append(sample)
+        # gif delays are in hundredths of a second
+        self.durations.append(max(int(round(duration / 10.0)) * 10, 10))
+
+    def palette(self):
+        """A 256 color palette image quantized from the frame samples."""
+        step = -(-len(self.samples) // MAXSAMPLES)
+        samples = self.samples[::step]
+        sheet = Image.new('RGB', (max(sample.size[0] for sample in samples),
+            sum(sample.size[1] for sample in samples)), (255, 255, 255))
+        top = 0
+        for sample in samples:
+            sheet.paste(sample, (0, top))
+            top += sample.size[1]
+        return sheet.quantize(256)
+
+    def close(self):
+        try:
+            if self.frames:
+                palette = self.palette()
+                for n, (path, duration) in enumerate(zip(self.frames, self.durations)):
+                    image = flatten(path).quantize(palette=palette)
+                    if n == 0:
+                        header, used = GifImagePlugin.getheader(image, info={'loop': 0,
+                            'optimize': False})
+                        self.f.write(b''.join(header))
+                    data = GifImagePlugin.getdata(image, duration=duration, optimize=False)
+                    self.f.write(b''.join(data))
+                    # pillow keeps the list on a class in a reference cycle,
+                    # empty it so the frame is freed now and not by the gc
+                    del data[:]
+                    os.remove(path)
+                # the gif trailer
+                self.f.write(b';')
+        finally:
+            self.f.close()
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+class Y4mWriter(object):
+    """Writes a YUV4MPEG2 stream, 4:4:4 chroma, that ffmpeg and most
+    encoders read from a file or a named pipe. The stream has a constant
+    rate of one picture every rate milliseconds, longer frames are
+    repeated to hold them."""
+    def __init__(self, filename, rate):
+        self.filename = filename
+        self.rate = rate
+        self.f = open(filename, 'wb')
+        self.size = None
+
+    def add(self, filename, duration):
+        image = flatten(filename)
+        if self.size is None:
+            self.size = image.size
+            self.f.write(('YUV4MPEG2 W%d H%d F%d:1000 Ip A1:1 C444\n' % (image.size[0],
+                image.size[1], int(round(1000000.0 / self.rate)))).encode('ascii'))
+        elif image.size != self.size:
+            raise ValueError('%s does not match the size of the first frame' % (filename))
+        rgb = numpy.asarray(image, dtype=numpy.float32) / 255.0
+        r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        # BT.601 studio range
+        y = 16.0 + 65.481 * r + 128.553 * g + 24.966 * b
+        cb = 128.0 - 37.797 * r - 74.203 * g + 112.0 * b
+        cr = 128.0 + 112.0 * r - 93.786 * g - 18.214 * b
+        planes = numpy.clip(numpy.array([y, cb, cr]) + 0.5, 0, 255).astype(numpy.uint8)
+        picture = b'FRAME\n' + planes.tobytes()
+        for i in range(max(int(round(duration / self.rate)), 1)):
+            self.f.write(picture)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+def pack(sizes, maxsize):
+    """Place rectangles on pages no larger than maxsize square, tallest
+    first along shelves. Returns a (page, x, y) position for each size in
+    order and the (width, height) used on each page."""
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    positions = [None] * len(sizes)
+    pages = []
+    # each page keeps its shelves as [y, height, next x]
+    shelves = []
+    for i in order:
+        w, h = sizes[i][0] + PADDING, sizes[i][1] + PADDING
+        placed = False
+        for page, pageshelves in enumerate(shelves):
+            for shelf in pageshelves:
+                if h <= shelf[1] and shelf[2] + w <= maxsize:
+                    positions[i] = (page, shelf[2], shelf[0])
+                    shelf[2] += w
+                    placed = True
+                    break
+            if placed:
+                break
+            top = 0
+            if pageshelves:
+                top = pageshelves[-1][0] + pageshelves[-1][1]
+            if top + h <= maxsize and w <= maxsize:
+                pageshelves.append([top, h, w])
+                positions[i] = (page, 0, top)
+                placed = True
+                break
+        if not placed:
+            # a new page, cells larger than maxsize get a page of their own
+            shelves.append([[0, h, w]])
+            positions[i] = (len(shelves) - 1, 0, 0)
+    for pageshelves in shelves:
+        pages.append((max(shelf[2] for shelf in pageshelves),
+            max(shelf[0] + shelf[1] for shelf in pageshelves)))
+    return positions, pages
+
+class AtlasWriter(object):
+    """Packs the frames into sprite sheet pages with a json description.
+    Frames are trimmed to their visible pixels as they are added and
+    frames with the same pixels share one cell, only the trimmed cells are
+    kept until the pages are written on close."""
+    def __init__(self, filename, maxsize=2048):
+        self.filename = filename
+        self.maxsize = maxsize
+        # opened now so an unwritable directory fails before the frames
+        # render, the pages are written next to it
+        self.f = open(filename, 'w')
+        self.cells = []
+        self.digests = {}
+        self.frames = []
+
+    def add(self, filename, duration):
+        image = Image.open(filename).convert('RGBA')
+        bbox = image.split()[3].getbbox()
+        if bbox is None:
+            # an empty frame keeps a single transparent pixel
+            bbox = (0, 0, 1, 1)
+        cell = image.crop(bbox)
+        digest = hashlib.sha1(cell.tobytes()).hexdigest() + '%dx%d' % cell.size
+        if digest not in self.digests:
+            self.digests[digest] = len(self.cells)
+            self.cells.append(cell)
+        self.frames.append({'filename': os.path.basename(filename),
+            'cell': self.digests[digest],
+            'trimmed': bbox != (0, 0) + image.size,
+            'spriteSourceSize': {'x': bbox[0], 'y': bbox[1],
+                'w': bbox[2] - bbox[0], 'h': bbox[3] - bbox[1]},
+            'sourceSize': {'w': image.size[0], 'h': image.size[1]},
+            'duration': duration})
+
+    def close(self):
+        try:
+            positions, pages = pack([cell.size for cell in self.cells], self.maxsize)
+            base = os.path.splitext(self.filename)[0]
+            names = []
+            for page, size in enumerate(pages):
+                sheet = Image.new('RGBA', size, (0, 0, 0, 0))
+                for cell, position in zip(self.cells, positions):
+                    if position[0] == page:
+                        sheet.paste(cell, position[1:])
+                names.append('%s-%d.png' % (os.path.basename(base), page))
+                sheet.save(os.path.join(os.path.dirname(self.filename), names[-1]))
+            for frame in self.frames:
+                page, x, y = positions[frame['cell']]
+                w, h = self.cells[frame['cell']].size
+                frame['page'] = page
+                frame['frame'] = {'x': x, 'y': y, 'w': w, 'h': h}
+            json.dump({'frames': self.frames,
+                'meta': {'pages': names, 'cells': len(self.cells)}}, self.f, indent=1, sort_keys=True)
+        finally:
+            self.f.close()
+
+def writer(animformat, filename, durations, maxsize=2048):
+    """An animation writer for animformat, durations lists the frame
+    durations in milliseconds and maxsize limits sprite sheet pages. Raises ValueError when the format or the
+    modules it needs are not available."""
+    if animformat == 'apng':
+        return ApngWriter(filename)
+    if animformat == 'gif':
+        if not bimage:
+            raise ValueError('PIL is needed to write gif animations')
+        return GifWriter(filename)
+    if animformat == 'y4m':
+        if not (bimage and bnumpy):
+            raise ValueError('numpy and PIL are needed to write y4m streams')
+        return Y4mWriter(filename, min([duration for duration in durations if duration > 0] or [83.3]))
+    if animformat == 'atlas':
+        if not bimage:
+            raise ValueError('PIL is needed to write sprite sheets')
+        return AtlasWriter(filename, maxsize)
+    raise ValueError('unknown animation format %s' % (animformat))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+framecomposite.py
+Exports frames by rendering shared backgrounds once and compositing
+each frame's foreground over them.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, shutil, tempfile
+import inkshell
+from inkshell import ExportJob, export_command
+
+try:
+    import numpy
+    from PIL import Image
+    bnumpy = True
+except:
+    bnumpy = False
+
+def is_hidden(node):
+    # compact frames hide the frame number with the display attribute
+    return (node.get('display') == 'none' or
+        'display:none' in (node.get('style') or '').replace(' ', ''))
+
+def layer_signature(node):
+    """Layer content without ids, equal for layers that draw the same.
+    Namespace prefixes are left out by comparing resolved tag names."""
+    parts = []
+    for child in node.iter():
+        attrs = sorted((name, value) for name, value in child.attrib.items() if name != 'id')
+        tail = None
+        if child is not node:
+            tail = child.tail
+        parts.append(repr((child.tag, attrs, child.text, tail, len(child))))
+    return '\n'.join(parts)
+
+# children of a frame layer that draw nothing themselves, the preview
+# timings and the like
+UNDRAWN = ('set', 'animate', 'title', 'desc', 'metadata', 'defs')
+
+def has_foreground(frame):
+    """Whether anything visible besides the background is in the frame
+    layer, the pencil, paint and ink sublayers, the frame number or
+    drawing put straight in the layer."""
+    layer = frame.get('f')
+    if layer is None:
+        return False
+    for child in layer:
+        # comments and processing instructions do not have a string tag
+        if child is frame.get('bg') or not hasattr(child.tag, 'split') or is_hidden(child):
+            continue
+        tag = child.tag.split('}')[-1]
+        if tag in UNDRAWN or (tag == 'g' and not len(child)):
+            continue
+        return True
+    return False
+
+def load_rgba(path):
+    return numpy.asarray(Image.open(path).convert('RGBA'), dtype=numpy.float32) / 255.0
+
+def save_rgba(rgba, path):
+    rgba = (numpy.clip(rgba, 0.0, 1.0) * 255.0 + 0.5).astype(numpy.uint8)
+    Image.fromarray(rgba, 'RGBA').save(path)
+
+def area_offset(area, height):
+    """Pixel position of the top left corner of an exported area on a page
+    image height pixels tall."""
+    x0, y0, x1, y1, w, h = area
+    scale = 1.0
+    if x1 > x0:
+        scale = w / (x1 - x0)
+    return int(round(x0 * scale)), int(round(height - y1 * scale))
+
+def over(background, foreground, left, top):
+    """Alpha blend foreground onto a copy of background with its top left
+    corner at (left, top). Both are float RGBA arrays with straight alpha."""
+    out = background.copy()
+    height, width = background.shape[:2]
+    fheight, fwidth = foreground.shape[:2]
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + fwidth, width), min(top + fheight, height)
+    if x0 >= x1 or y0 >= y1:
+        return out
+    f = foreground[y0 - top:y1 - top, x0 - left:x1 - left]
+    b = out[y0:y1, x0:x1]
+    fa = f[..., 3:4]
+    ba = b[..., 3:4] * (1.0 - fa)
+    alpha = fa + ba
+    rgb = f[..., :3] * fa + b[..., :3] * ba
+    out[y0:y1, x0:x1, :3] = rgb / numpy.maximum(alpha, 1e-6)
+    out[y0:y1, x0:x1, 3:4] = alpha
+    return out
+
+def copy_timings(job, shelljob):
+    for name in inkshell.TIMINGS:
+        setattr(job, name, getattr(shelljob, name))
+
+def export_composite(document, index, jobs, workers=1, daemon=None, retries=0, progress=None,
+        dpi=None):
+    """Export jobs rendering each distinct background once. Each frame's
+    foreground is exported clipped to its bounding box and composited over
+    the cached background. Frames with a hidden or missing background are
+    exported whole. Returns the ShellWorker list like inkshell.export,
+    which daemon, retries and progress are passed on to. Progress counts
+    the background and foreground exports. dpi is the export resolution
+    of every layer."""
+    tmpdir = tempfile.mkdtemp(prefix='outputframes')
+    try:
+        # the shells read the document as currently edited, backgrounds
+        # come from one copy and foregrounds from a copy without them
+        bgfile = os.path.join(tmpdir, 'background.svg')
+        fgfile = os.path.join(tmpdir, 'foreground.svg')
+        document.write(bgfile)
+        shelljobs = []
+        backgrounds = {}
+        plan = []
+        hidden = []
+        for job in jobs:
+            frame = index.frames[job.framenum]
+            bg = frame.get('bg')
+            if bg is None or is_hidden(bg):
+                whole = ExportJob(job.framenum, job.frame, job.idattr, job.filename,
+                    export_command(bgfile, job.idattr, job.filename, dpi=dpi))
+                shelljobs.append(whole)
+                plan.append((job, None, whole))
+                continue
+            signature = layer_signature(bg)
+            if signature not in backgrounds:
+                filename = os.path.join(tmpdir, 'bg%d.png' % (len(backgrounds)))
+                backgrounds[signature] = ExportJob(job.framenum, job.frame, bg.get('id'),
+                    filename, export_command(bgfile, bg.get('id'), filename, dpi=dpi))
+                shelljobs.append(backgrounds[signature])
+            fgjob = None
+            if has_foreground(frame):
+                filename = os.path.join(tmpdir, 'fg%s.png' % (job.frame))
+                fgjob = ExportJob(job.framenum, job.frame, job.idattr, filename,
+                    export_command(fgfile, job.idattr, filename, canvas=False, dpi=dpi))
+                shelljobs.append(fgjob)
+                hidden.append((bg, bg.get('style')))
+            plan.append((job, backgrounds[signature], fgjob))
+        for bg, style in hidden:
+            bg.set('style', 'display:none')
+        document.write(fgfile)
+        for bg, style in hidden:
+            if style is None:
+                del bg.attrib['style']
+            else:
+                bg.set('style', style)
+
+        if progress is not None:
+            progress.expect(len(shelljobs))
+        shells = inkshell.export(shelljobs, workers, daemon=daemon, retries=retries,
+            progress=progress)
+
+        cache = {}
+        for job, bgjob, fgjob in plan:
+            # frames are timed by the export that drew their foreground
+            copy_timings(job, fgjob or bgjob)
+            if bgjob is None:
+                job.ok, job.error, job.size = fgjob.ok, fgjob.error, fgjob.size
+                continue
+            if not bgjob.ok:
+                job.error = 'background %s: %s' % (bgjob.idattr, bgjob.error)
+                continue
+            if fgjob is not None and not fgjob.ok:
+                job.error = fgjob.error
+                continue
+            if fgjob is not None and fgjob.area is None:
+                job.error = 'no export area reported for %s' % (fgjob.idattr)
+                continue
+            try:
+                if fgjob is None:
+                    shutil.copyfile(bgjob.filename, job.filename)
+                else:
+                    if bgjob.filename not in cache:
+                        cache[bgjob.filename] = load_rgba(bgjob.filename)
+                    background = cache[bgjob.filename]
+                    left, top = area_offset(fgjob.area, background.shape[0])
+                    save_rgba(over(background, load_rgba(fgjob.filename), left, top),
+                        job.filename)
+                job.size = os.path.getsize(job.filename)
+            except (IOError, OSError) as e:
+                job.error = str(e)
+                continue
+            job.ok = True
+        return shells
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+framelayers.py
+Shared lookup of the frame layers created by importpenciltest.py.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import re
+
+# frame layer ids are a sublayer kind followed by the frame number
+# ex. f001, ink001, on001, frametext001
+FRAMEID = re.compile(r'^(f|bg|bgfill|paint|ink|pencil|pimage|init|on|off|frametext|tspan)(\d{3,})$')
+
+# style of the frame number text, display is set separately
+FRAMETEXTSTYLE = 'font-size:18px;font-style:normal;font-weight:normal;line-height:125%;letter-spacing:0px;word-spacing:0px;fill:#000000;fill-opacity:0.3;stroke:none;font-family:Sans'
+
+# SMIL clock values ex. 83.3ms, 0.5s
+CLOCKVALUE = re.compile(r'^\s*([\d.]+)\s*(ms|s|min|h)?\s*$')
+CLOCKUNITS = {'ms': 1.0, 's': 1000.0, 'min': 60000.0, 'h': 3600000.0, None: 1000.0}
+
+# the preview timeline layer shows each of these sublayers through a
+# <use> whose href is animated over the frames
+TIMELINE = 'timeline'
+TIMELINEKINDS = ('bg', 'pencil', 'paint', 'ink', 'frametext')
+
+# sublayers whose children are part of the frame layout, the content of
+# the ink and paint sublayers is never visited
+DESCEND = ('f', 'bg', 'pencil')
+
+def parse_frame_id(idattr):
+    """Split a frame layer id into (frametype, frame) or return None.
+    frame is the number string as it appears in the id ex. '001'"""
+    if not idattr:
+        return None
+    match = FRAMEID.match(idattr)
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+def parse_clock(value):
+    """A SMIL clock value in milliseconds or None."""
+    match = CLOCKVALUE.match(value or '')
+    if match is None:
+        return None
+    try:
+        return float(match.group(1)) * CLOCKUNITS[match.group(2)]
+    except ValueError:
+        return None
+
+def read_timeline(animate):
+    """The frames of a timeline animate in order and how long each is
+    held in milliseconds."""
+    values = [value.strip() for value in (animate.get('values') or '').split(';')]
+    frames = []
+    for value in values:
+        parsed = parse_frame_id(value.lstrip('#'))
+        if parsed is not None:
+            frames.append(parsed[1])
+    keytimes = [float(keytime) for keytime in (animate.get('keyTimes') or '').split(';') if keytime.strip()]
+    total = parse_clock(animate.get('dur')) or 0.0
+    if len(keytimes) != len(frames):
+        # no usable timing, share the duration evenly
+        keytimes = [i / float(max(len(frames), 1)) for i in range(len(frames))]
+    ends = keytimes[1:] + [1.0]
+    # rounded to the microsecond so repeated edits do not drift
+    holds = [round((end - begin) * total, 3) for begin, end in zip(keytimes, ends)]
+    return frames, holds
+
+def write_timeline(animate, frametype, frames, holds):
+    """Set a discrete timeline animate to show frames in order, each held
+    for its hold in milliseconds."""
+    total = sum(holds)
+    keytimes = []
+    elapsed = 0.0
+    for hold in holds:
+        keytimes.append(elapsed / total if total else 0.0)
+        elapsed += hold
+    animate.set('values', ';'.join('#%s%s' % (frametype, frame) for frame in frames))
+    animate.set('keyTimes', ';'.join('%.10g' % (keytime) for keytime in keytimes))
+    animate.set('dur', '%sms' % (round(total, 3)))
+
+def is_group(node):
+    tag = node.tag
+    # comments and processing instructions do not have a string tag
+    if not hasattr(tag, 'split'):
+        return False
+    return tag.split('}')[-1] == 'g'
+
+class FrameIndex(object):
+    """Maps frame numbers to their frame layer nodes.
+    The index is built once per run. Only the frame layers and their
+    direct sublayers are visited so the drawn content is never walked."""
+    def __init__(self, svg):
+        self.svg = svg
+        self.frames = {}
+        self.framestrs = {}
+        self.timeline = {}
+        self.holds = None
+        self.build()
+
+    def build(self):
+        self.frames = {}
+        self.framestrs = {}
+        self.timeline = {}
+        self.holds = None
+        stack = [self.svg]
+        while stack:
+            node = stack.pop()
+            for child in node:
+                if child.get('id') == TIMELINE:
+                    # the animates are two levels down, one per kind
+                    for use in child:
+                        for animate in use:
+                            idattr = animate.get('id') or ''
+                            if idattr.startswith(TIMELINE + '-'):
+                                self.timeline[idattr[len(TIMELINE) + 1:]] = animate
+                    continue
+                parsed = parse_frame_id(child.get('id'))
+                if parsed is None:
+                    # follow plain layers and groups in case frames were
+                    # moved inside another layer
+                    if is_group(child):
+                        stack.append(child)
+                    continue
+                frametype, frame = parsed
+                framenum = int(frame)
+                self.frames.setdefault(framenum, {})[frametype] = child
+                self.framestrs[framenum] = frame
+                if frametype in DESCEND:
+                    stack.append(child)
+
+    def framenums(self, fromframe=None, toframe=None):
+        """Sorted frame numbers between fromframe and toframe inclusive."""
+        return sorted(framenum for framenum in self.frames
+            if (fromframe is None or fromframe <= framenum)
+            and (toframe is None or framenum <= toframe))
+
+    def frame(self, framenum):
+        """The frame number as written in the layer ids ex. '001'"""
+        return self.framestrs.get(framenum, format(framenum, '03d'))
+
+    def get(self, framenum, frametype):
+        return self.frames.get(framenum, {}).get(frametype)
+
+    def nodes(self, frametype, fromframe=None, toframe=None):
+        """Yield (framenum, node) for each frame in the range that has
+        a frametype node."""
+        for framenum in self.framenums(fromframe, toframe):
+            node = self.frames[framenum].get(frametype)
+            if node is not None:
+                yield framenum, node
+
+    def duration(self, framenum, default=None):
+        """How long the frame is shown in milliseconds, read from the dur
+        of its on### preview timing or from the preview timeline."""
+        node = self.get(framenum, 'on')
+        if node is None:
+            if self.holds is None:
+                self.holds = {}
+                for animate in self.timeline.values():
+                    frames, holds = read_timeline(animate)
+                    self.holds = dict(zip([int(frame) for frame in frames], holds))
+                    break
+            return self.holds.get(framenum, default)
+        duration = parse_clock(node.get('dur'))
+        if duration is None:
+            return default
+        return duration
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+framemanifest.py
+Content digests of frame layers used to skip frames that have not
+changed since the last export.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, re, json, hashlib, inkex
+
+MANIFEST_VERSION = 1
+
+# url(#id) in styles and presentation attributes
+URLREF = re.compile(r'url\(\s*#([^)\s]+)\s*\)')
+
+def manifest_path(dirname, image):
+    return os.path.join(dirname, image + '.manifest.json')
+
+def load_manifest(path):
+    """Read a manifest, an unreadable or outdated one is treated as empty."""
+    try:
+        f = open(path)
+        try:
+            manifest = json.load(f)
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('frames', {})
+
+def save_manifest(path, frames):
+    # write to a temporary file first so an interrupted run never
+    # leaves a truncated manifest behind
+    tmp = path + '.tmp'
+    f = open(tmp, 'w')
+    try:
+        json.dump({'version': MANIFEST_VERSION, 'frames': frames}, f,
+            indent=1, sort_keys=True)
+    finally:
+        f.close()
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp, path)
+
+def node_refs(node):
+    """Ids referenced from the attributes of node and its descendants."""
+    href = inkex.addNS('href', 'xlink')
+    refs = set()
+    for child in node.iter():
+        for name, value in child.attrib.items():
+            if name == href or name == 'href':
+                if value.startswith('#'):
+                    refs.add(value[1:])
+            elif 'url(' in value:
+                refs.update(URLREF.findall(value))
+    return refs
+
+class FrameDigest(object):
+    """Computes a stable digest of a frame layer, the defs it references,
+    the files its images link to, the document size and export options."""
+    def __init__(self, svg, options='', docbase=None):
+        self.svg = svg
+        self.options = options
+        if docbase is None:
+            docbase = svg.get(inkex.addNS('docbase', 'sodipodi')) or ''
+        self.docbase = docbase
+        self.defs = None
+        self.docsize = '%s %s %s' % (svg.get('width'), svg.get('height'), svg.get('viewBox'))
+
+    def lookup(self, idattr):
+        # ids are found in defs first, anything else is searched for
+        if self.defs is None:
+            self.defs = {}
+            for defs in self.svg.iterchildren(inkex.addNS('defs', 'svg')):
+                for child in defs.iter():
+                    if child.get('id'):
+                        self.defs[child.get('id')] = child
+        if idattr in self.defs:
+            return self.defs[idattr]
+        found = self.svg.xpath('//*[@id=$idattr]', idattr=idattr)
+        if found:
+            return found[0]
+        return None
+
+    def image_state(self, node):
+        # linked images are identified by path, size and modification time
+        href = node.get(inkex.addNS('href', 'xlink')) or node.get('href') or ''
+        if href.startswith('#') or href.startswith('data:'):
+            return ''
+        path = href
+        if path.startswith('file://'):
+            path = path[7:]
+        path = os.path.join(self.docbase, os.path.expanduser(path))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return '%s missing' % (href)
+        return '%s %d %d' % (href, stat.st_size, int(stat.st_mtime))
+
+    def digest(self, node):
+        sha = hashlib.sha1()
+        sha.update(self.docsize.encode('utf-8'))
+        sha.update(self.options.encode('utf-8'))
+        seen = set()
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            sha.update(inkex.etree.tostring(current, with_tail=False))
+            for image in current.iter(inkex.addNS('image', 'svg')):
+                sha.update(self.image_state(image).encode('utf-8'))
+            for ref in sorted(node_refs(current) - seen):
+                seen.add(ref)
+                refnode = self.lookup(ref)
+                if refnode is not None:
+                    pending.append(refnode)
+                else:
+                    sha.update(('missing #%s' % (ref)).encode('utf-8'))
+        return sha.hexdigest()
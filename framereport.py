@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+framereport.py
+Timings, sizes and memory use of a frame export, shown as progress while
+the frames render and written to a json or csv report afterwards.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, sys, csv, json, time, threading
+
+try:
+    import resource
+    bresource = True
+except:
+    bresource = False
+
+# report columns, times are seconds and memory is kB
+FIELDS = ('frame', 'id', 'file', 'ok', 'error', 'attempts', 'issued', 'render',
+    'write', 'latency', 'size', 'rss', 'warnings')
+
+# how many of the slowest frames the summary names
+SLOWEST = 5
+
+def seconds(value, start=0.0):
+    if value is None:
+        return None
+    return round(value - start, 4)
+
+def frame_row(job, start=0.0):
+    """The report columns for one ExportJob, issued is counted from start."""
+    return {'frame': job.frame, 'id': job.idattr,
+        'file': os.path.basename(job.filename), 'ok': job.ok,
+        'error': job.error, 'attempts': job.attempts,
+        'issued': seconds(job.issued, start), 'render': seconds(job.render),
+        'write': seconds(job.write), 'latency': seconds(job.latency),
+        'size': job.size, 'rss': job.rss, 'warnings': len(job.warnings)}
+
+def peak_memory():
+    """Peak resident memory in kB of this process and of the inkscape
+    shells it waited for, None where it is not known."""
+    if not bresource:
+        return {'self': None, 'shells': None}
+    # linux counts kB, mac os counts bytes
+    scale = 1
+    if sys.platform == 'darwin':
+        scale = 1024
+    return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        'shells': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale}
+
+def summary(jobs, start, skipped=0):
+    timed = [job for job in jobs if job.render is not None]
+    timed.sort(key=lambda job: -job.render)
+    rss = [job.rss for job in jobs if job.rss is not None]
+    return {'frames': len(jobs), 'failed': len([job for job in jobs if not job.ok]),
+        'retried': len([job for job in jobs if job.attempts > 1]),
+        'skipped': skipped, 'elapsed': seconds(time.time(), start),
+        'render': round(sum(job.render for job in timed), 4),
+        'bytes': sum(job.size or 0 for job in jobs),
+        'peakrss': max(rss or [None]), 'memory': peak_memory(),
+        'slowest': [job.idattr for job in timed[:SLOWEST]]}
+
+def write_report(path, jobs, start, shells=(), skipped=0):
+    """Write a row for each job to path, as csv when it ends in .csv and
+    as json with a summary and the shell logs otherwise."""
+    rows = [frame_row(job, start) for job in jobs]
+    tmp = path + '.tmp'
+    f = open(tmp, 'w')
+    try:
+        if path.lower().endswith('.csv'):
+            writer = csv.DictWriter(f, FIELDS)
+            writer.writerow(dict((field, field) for field in FIELDS))
+            writer.writerows(rows)
+        else:
+            json.dump({'frames': rows, 'summary': summary(jobs, start, skipped),
+                'warnings': dict((job.idattr, job.warnings) for job in jobs if job.warnings),
+                'shells': [{'returncode': shell.returncode, 'error': shell.error,
+                    'stderr': ''.join(shell.stderr)} for shell in shells]},
+                f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+    os.rename(tmp, path)
+
+class Progress(object):
+    """Prints a line for each frame as it is saved or fails. Called from
+    the shell reader threads. count is the frames saved and failed the
+    ids of the jobs whose last export failed, a retried frame that is
+    saved leaves it."""
+    def __init__(self, total, stream=None):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.count = 0
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def expect(self, total):
+        self.total = total
+
+    def __call__(self, job):
+        with self.lock:
+            render = ''
+            if job.render is not None:
+                render = ' %.2fs' % (job.render)
+            status = ''
+            if job.ok:
+                self.count += 1
+                self.failed.discard(id(job))
+            else:
+                self.failed.add(id(job))
+                status = ' failed: %s' % (job.error)
+            self.stream.write('[%*d/%d] %s%s%s\n' % (len(str(self.total)), self.count,
+                self.total, job.idattr, render, status))
+            self.stream.flush()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+framescale.py
+Derives smaller copies of exported frames so each frame is rendered
+once, at the largest output scale.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, re
+
+try:
+    import numpy
+    from PIL import Image
+    bnumpy = True
+except:
+    bnumpy = False
+
+# pixels per inch of a px, the export dpi of scale 1: the css 96 from
+# inkscape 0.91 on, 90 before
+DPI = 96.0
+LEGACYDPI = 90.0
+VERSION = '{http://www.inkscape.org/namespaces/inkscape}version'
+VERSIONNUMBER = re.compile(r'^\s*(\d+)\.(\d+)')
+
+def document_dpi(svg):
+    """The export dpi that gives one pixel per px of the document, by the
+    inkscape:version inkscape writes on the documents it hands extensions.
+    Without one the current inkscape is assumed."""
+    match = VERSIONNUMBER.match(svg.get(VERSION) or '')
+    if match is not None and (int(match.group(1)), int(match.group(2))) < (0, 91):
+        return LEGACYDPI
+    return DPI
+
+def parse_scales(value):
+    """Sorted distinct scales from a comma separated list ex. '0.5,1,2'.
+    Raises ValueError for anything that is not a positive number."""
+    scales = set()
+    for part in (value or '').split(','):
+        if part.strip():
+            scale = float(part.strip().rstrip('xX'))
+            if scale <= 0:
+                raise ValueError('scale %s is not positive' % (part.strip()))
+            scales.add(scale)
+    return sorted(scales)
+
+def scale_dir(dirname, scale):
+    # ex. frames/0.5x, frames/2x
+    return os.path.join(dirname, '%gx' % (scale))
+
+def area_taps(source, target):
+    """For each target pixel the source pixels under it and their share
+    of it, as (target x taps) index and weight arrays. A target pixel
+    covers source / target source pixels, a few more taps than that catch
+    the partly covered ones at its edges."""
+    ratio = float(source) / target
+    starts = numpy.arange(target, dtype=numpy.float64) * ratio
+    taps = int(numpy.ceil(ratio)) + 1
+    index = numpy.floor(starts).astype(numpy.intp)[:, None] + numpy.arange(taps)[None, :]
+    # taps past the last source pixel overlap nothing
+    weight = (numpy.minimum(index + 1.0, (starts + ratio)[:, None]) -
+        numpy.maximum(index, starts[:, None])).clip(0.0, None) / ratio
+    return index.clip(0, source - 1), weight.astype(numpy.float32)
+
+def downscale(rgba, size):
+    """Resize a uint8 RGBA array to size (width, height) by area
+    averaging. Colors are averaged with premultiplied alpha so transparent
+    pixels do not darken the edges."""
+    height, width = rgba.shape[:2]
+    pixels = rgba.astype(numpy.float32) / 255.0
+    pixels[..., :3] *= pixels[..., 3:4]
+    # rows then columns, each tap is one operation over the whole image
+    index, weight = area_taps(height, size[1])
+    scaled = numpy.zeros((size[1], width, 4), numpy.float32)
+    for tap in range(index.shape[1]):
+        scaled += pixels[index[:, tap]] * weight[:, tap, None, None]
+    pixels = scaled
+    index, weight = area_taps(width, size[0])
+    scaled = numpy.zeros((size[1], size[0], 4), numpy.float32)
+    for tap in range(index.shape[1]):
+        scaled += pixels[:, index[:, tap]] * weight[None, :, tap, None]
+    alpha = scaled[..., 3:4]
+    scaled[..., :3] /= numpy.maximum(alpha, 1e-6)
+    return (scaled.clip(0.0, 1.0) * 255.0 + 0.5).astype(numpy.uint8)
+
+def derive(filename, targets):
+    """Write a smaller copy of the image filename for each (path, ratio)
+    in targets, ratio being the target scale over the rendered scale."""
+    rgba = numpy.asarray(Image.open(filename).convert('RGBA'))
+    height, width = rgba.shape[:2]
+    for path, ratio in targets:
+        size = (max(int(round(width * ratio)), 1), max(int(round(height * ratio)), 1))
+        Image.fromarray(downscale(rgba, size), 'RGBA').save(path)
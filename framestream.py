@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+framestream.py
+Edits the frame layers of a document while it is parsed and written out
+one element at a time, so documents with hundreds of MB of embedded
+pencil images are changed without holding them in memory.
+It is part of the Inkscape animation extension
+
+The output is byte for byte what lxml writes for the whole tree after
+the same edits.
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import re
+from lxml import etree
+from framelayers import TIMELINE, DESCEND, parse_frame_id, is_group
+
+# a namespace declaration at the start of a serialized start tag
+NSDECL = re.compile(br'\s+xmlns(?::[^=\s]+)?="[^"]*"')
+TAGNAME = re.compile(br'<[^\s/>]+')
+
+# how the children of an element are looked at, the same walk as
+# framelayers.FrameIndex
+SKIP, VISIT, TIMELINEUSES, TIMELINEANIMATES = range(4)
+
+def own_declarations(serialized, owncount):
+    """lxml adds the namespaces declared on the ancestors to the start
+    tag of a serialized element, after the element's own. Keep only the
+    first owncount declarations like a write of the whole tree does."""
+    start = TAGNAME.match(serialized).end()
+    position = start
+    declarations = []
+    while True:
+        match = NSDECL.match(serialized, position)
+        if match is None:
+            break
+        declarations.append(match.group(0))
+        position = match.end()
+    if len(declarations) == owncount:
+        return serialized
+    return serialized[:start] + b''.join(declarations[:owncount]) + serialized[position:]
+
+def escape_text(text):
+    # let lxml escape the text like it does in a tree
+    holder = etree.Element('t')
+    holder.text = text
+    return etree.tostring(holder)[3:-4]
+
+def end_tag(elem):
+    name = etree.QName(elem).localname
+    if elem.prefix:
+        name = '%s:%s' % (elem.prefix, name)
+    return ('</%s>' % (name)).encode('ascii')
+
+class Open(object):
+    """An element whose start tag is read and end tag is not."""
+    def __init__(self, elem, owncount, walk):
+        self.elem = elem
+        self.owncount = owncount
+        self.walk = walk
+        self.head = None
+        self.started = False
+        # the last child written, its tail follows once it is parsed
+        self.previous = None
+
+class FrameStream(object):
+    """Copies a document from source to out calling edit(framenum,
+    frametype, node) for each frame layer node framelayers.FrameIndex
+    would find, and timeline(frametype, animate) for each preview
+    timeline animate. The edits may only change the attributes of the
+    node they are given."""
+    def __init__(self, edit, timeline=None):
+        self.edit = edit
+        self.timeline = timeline
+
+    def walk_child(self, parent, elem):
+        """Edit elem if it is a frame layer node and return how its
+        children are walked."""
+        if parent is None:
+            return VISIT
+        if parent.walk == TIMELINEUSES:
+            return TIMELINEANIMATES
+        if parent.walk == TIMELINEANIMATES:
+            idattr = elem.get('id') or ''
+            if self.timeline is not None and idattr.startswith(TIMELINE + '-'):
+                self.timeline(idattr[len(TIMELINE) + 1:], elem)
+            return SKIP
+        if parent.walk != VISIT:
+            return SKIP
+        if elem.get('id') == TIMELINE:
+            return TIMELINEUSES
+        parsed = parse_frame_id(elem.get('id'))
+        if parsed is None:
+            if is_group(elem):
+                return VISIT
+            return SKIP
+        frametype, frame = parsed
+        self.edit(int(frame), frametype, elem)
+        if frametype in DESCEND:
+            return VISIT
+        return SKIP
+
+    def start_tag(self, node):
+        """The start tag of the element, read when the parser has just
+        passed it so few of its children are there to serialize too.
+        Values escape > so the first one closes the tag."""
+        serialized = etree.tostring(node.elem, with_tail=False)
+        end = serialized.index(b'>')
+        if serialized[end - 1:end] == b'/':
+            end -= 1
+        node.head = own_declarations(serialized[:end], node.owncount) + b'>'
+
+    def start(self, out, node):
+        # the text is complete once the first child is parsed
+        out.write(node.head)
+        if node.elem.text:
+            out.write(escape_text(node.elem.text))
+        node.started = True
+
+    def finish_previous(self, out, node):
+        # the tail of the previous child is complete once the parser
+        # has moved past it
+        previous = node.previous
+        if previous is None:
+            return
+        if previous.tail:
+            out.write(escape_text(previous.tail))
+        node.elem.remove(previous)
+        node.previous = None
+
+    def child(self, out, stack):
+        if stack:
+            if not stack[-1].started:
+                self.start(out, stack[-1])
+            self.finish_previous(out, stack[-1])
+
+    def transform(self, source, out):
+        """Stream source, a file name or file object, to the binary file
+        object out. Raises ValueError for documents with an internal DTD
+        subset, those are only written correctly from a tree."""
+        stack = []
+        declared = 0
+        prolog = False
+        events = etree.iterparse(source, events=('start', 'end', 'start-ns', 'comment', 'pi'),
+            huge_tree=True)
+        for event, elem in events:
+            if event == 'start-ns':
+                declared += 1
+                continue
+            if not prolog:
+                self.prolog(out, elem)
+                prolog = True
+            if event == 'start':
+                self.child(out, stack)
+                parent = None
+                if stack:
+                    parent = stack[-1]
+                # an edit may declare a namespace the document lacks
+                namespaces = len(elem.nsmap)
+                walk = self.walk_child(parent, elem)
+                declared += len(elem.nsmap) - namespaces
+                stack.append(Open(elem, declared, walk))
+                self.start_tag(stack[-1])
+                declared = 0
+            elif event == 'end':
+                node = stack.pop()
+                if node.started:
+                    self.finish_previous(out, node)
+                    out.write(end_tag(elem))
+                else:
+                    out.write(own_declarations(etree.tostring(elem, with_tail=False),
+                        node.owncount))
+                if stack:
+                    stack[-1].previous = elem
+            else:
+                # comments and processing instructions
+                self.child(out, stack)
+                out.write(etree.tostring(elem, with_tail=False))
+                if stack:
+                    stack[-1].previous = elem
+
+    def prolog(self, out, first):
+        docinfo = first.getroottree().docinfo
+        dtd = getattr(docinfo, 'internalDTD', None)
+        if dtd is not None and (list(dtd.iterelements()) or list(dtd.entities())):
+            raise ValueError('documents with an internal DTD subset can not be streamed')
+        if docinfo.doctype:
+            out.write(docinfo.doctype.encode('utf-8') + b'\n')
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+frametween.py
+Interpolates the drawing in one keyframe sublayer towards another, path
+nodes, shapes, transforms and colors, for all the frames in between at
+once with numpy.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import re, copy, math, inkex, simplepath, simplestyle, simpletransform
+
+try:
+    import numpy
+    bnumpy = True
+except:
+    bnumpy = False
+
+# eased time for linear time t, an array between 0 and 1
+EASINGS = {
+    'linear': lambda t: t,
+    'easein': lambda t: t ** 3,
+    'easeout': lambda t: 1 - (1 - t) ** 3,
+    'easeinout': lambda t: numpy.where(t < 0.5, 4 * t ** 3, 1 - (2 - 2 * t) ** 3 / 2),
+}
+
+def ease(easing, times):
+    """The eased times as an array, linear for an unknown easing."""
+    return EASINGS.get(easing, EASINGS['linear'])(numpy.asarray(times, numpy.float64))
+
+# shape attributes interpolated when both keyframes give a plain number
+GEOMETRY = ('x', 'y', 'width', 'height', 'cx', 'cy', 'r', 'rx', 'ry', 'x1', 'y1', 'x2', 'y2')
+# style properties, also read from the presentation attributes
+COLORS = ('fill', 'stroke')
+STYLENUMBERS = ('opacity', 'fill-opacity', 'stroke-opacity', 'stroke-width')
+
+# a number with an optional px unit, ex. 2.5 or 1px
+NUMBER = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(px)?\s*$')
+NUMBERFORMAT = '%g'
+COLORFORMAT = '#%02x%02x%02x'
+MATRIXFORMAT = 'matrix(%s)' % (','.join([NUMBERFORMAT] * 6))
+
+def is_element(node):
+    # comments and processing instructions do not have a string tag
+    return hasattr(node.tag, 'split')
+
+def elements(sublayer):
+    """The drawn elements of a sublayer in document order."""
+    return [node for child in sublayer for node in child.iter() if is_element(node)]
+
+def name(node, frame):
+    """What an element is matched by: its label, or its id without the
+    keyframe number ex. arm003 and arm009 are both arm."""
+    label = node.get(inkex.addNS('label', 'inkscape'))
+    if label:
+        return label
+    idattr = node.get('id') or ''
+    if idattr.endswith(frame) and len(idattr) > len(frame):
+        return idattr[:-len(frame)]
+    return idattr or None
+
+def match_elements(first, last, match, firstframe, lastframe):
+    """Pair each element of first with the element of last it turns into
+    as (position in first, element in last). Elements are paired by
+    position or by name and only with an element of the same tag."""
+    pairs = []
+    if match == 'name':
+        names = {}
+        for node in last:
+            names.setdefault(name(node, lastframe), node)
+        for position, node in enumerate(first):
+            other = names.get(name(node, firstframe))
+            if name(node, firstframe) is not None and other is not None and other.tag == node.tag:
+                pairs.append((position, other))
+    else:
+        for position, (node, other) in enumerate(zip(first, last)):
+            if other.tag == node.tag:
+                pairs.append((position, other))
+    return pairs
+
+def path_template(d):
+    """A format string for path data and the numbers that fill it, with
+    the path made absolute and without shorthand. Arc flags are part of
+    the format. None when the path does not parse."""
+    try:
+        segments = simplepath.parsePath(d or '')
+    except Exception:
+        # simplepath raises plain exceptions for bad path data
+        return None, None
+    parts = []
+    values = []
+    for command, params in segments:
+        formats = [NUMBERFORMAT] * len(params)
+        if command == 'A':
+            formats[3:5] = ['%d' % (params[3]), '%d' % (params[4])]
+            params = params[:3] + params[5:]
+        parts.append(' '.join([command] + formats))
+        values.extend(params)
+    return ' '.join(parts), values
+
+def number(value):
+    """(number, unit) of a plain number attribute or style value."""
+    match = NUMBER.match(value or '')
+    if match is None:
+        return None, None
+    return float(match.group(1)), match.group(2) or ''
+
+def color(value):
+    """(r, g, b) of a color value, None for none, paint servers and the like."""
+    value = (value or '').strip()
+    if not value or value in ('none', 'inherit', 'currentColor') or value.startswith('url('):
+        return None
+    try:
+        return tuple(simplestyle.parseColor(value))
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+def matrix(node):
+    # a, b, c, d, e, f
+    (a, c, e), (b, d, f) = simpletransform.parseTransform(node.get('transform') or '')
+    return [a, b, c, d, e, f]
+
+def decompose(matrices):
+    """(k, 6) matrices to translate x, y, rotation, x scale, shear and
+    y scale, interpolating those turns rotations into rotations instead
+    of squashing the drawing."""
+    a, b, c, d, e, f = matrices.T
+    angle = numpy.arctan2(b, a)
+    cos = numpy.cos(angle)
+    sin = numpy.sin(angle)
+    return numpy.column_stack((e, f, angle, numpy.hypot(a, b), cos * c + sin * d, cos * d - sin * c))
+
+def recompose(params):
+    e, f, angle, sx, shear, sy = [params[..., i] for i in range(6)]
+    cos = numpy.cos(angle)
+    sin = numpy.sin(angle)
+    return numpy.stack((cos * sx, sin * sx, cos * shear - sin * sy, sin * shear + cos * sy, e, f), axis=-1)
+
+class Batch(object):
+    """The start and end values of one kind of property of all the matched
+    elements, interpolated together. Each property is written with its
+    format, all of them with one format operation per frame."""
+    def __init__(self):
+        self.start = []
+        self.end = []
+        self.formats = []
+        # (position, 'attr' or 'style', name) of each format
+        self.targets = []
+
+    def add(self, start, end, format, target):
+        self.start.extend(start)
+        self.end.extend(end)
+        self.formats.append(format)
+        self.targets.append(target)
+
+    def arrays(self):
+        return numpy.array(self.start, numpy.float64), numpy.array(self.end, numpy.float64)
+
+    def texts(self, rows):
+        """The formatted properties for each row of values."""
+        if not self.formats:
+            return [[] for row in rows]
+        template = '\n'.join(self.formats)
+        return [(template % tuple(row)).split('\n') for row in rows]
+
+class Tween(object):
+    """The frames between the drawing in the keyframe sublayers first and
+    last. Elements of first without a match in last are held as they are,
+    so are paths whose nodes differ in number or kind (listed in held)."""
+    def __init__(self, first, last, match='order', firstframe='', lastframe=''):
+        self.first = first
+        self.held = []
+        self.styles = {}
+        self.numbers = Batch()
+        self.colors = Batch()
+        self.transforms = Batch()
+        nodes = elements(first)
+        self.count = len(nodes)
+        pairs = match_elements(nodes, elements(last), match, firstframe, lastframe)
+        self.matched = len(pairs)
+        for position, other in pairs:
+            self.add(position, nodes[position], other)
+
+    def add(self, position, node, other):
+        if node.tag.split('}')[-1] == 'path' and node.get('d') != other.get('d'):
+            template, start = path_template(node.get('d'))
+            othertemplate, end = path_template(other.get('d'))
+            if template is not None and template == othertemplate:
+                self.numbers.add(start, end, template, (position, 'attr', 'd'))
+            else:
+                self.held.append(node.get('id') or node.tag)
+        for attr in GEOMETRY:
+            start, unit = number(node.get(attr))
+            end, otherunit = number(other.get(attr))
+            if start is not None and end is not None and unit == otherunit and start != end:
+                self.numbers.add([start], [end], NUMBERFORMAT + unit, (position, 'attr', attr))
+        if node.get('transform') or other.get('transform'):
+            start = matrix(node)
+            end = matrix(other)
+            if start != end:
+                self.transforms.add(start, end, MATRIXFORMAT, (position, 'attr', 'transform'))
+        style = simplestyle.parseStyle(node.get('style') or '')
+        otherstyle = simplestyle.parseStyle(other.get('style') or '')
+        for prop in COLORS + STYLENUMBERS:
+            # the style property or else the presentation attribute
+            kind = 'style'
+            if prop not in style and node.get(prop) is not None:
+                kind = 'attr'
+            value = style.get(prop, node.get(prop))
+            othervalue = otherstyle.get(prop, other.get(prop))
+            if value is None or othervalue is None or value == othervalue:
+                continue
+            if prop in COLORS:
+                start = color(value)
+                end = color(othervalue)
+                if start is None or end is None:
+                    continue
+                self.colors.add(start, end, COLORFORMAT, (position, kind, prop))
+            else:
+                start, unit = number(value)
+                end, otherunit = number(othervalue)
+                if start is None or end is None or unit != otherunit:
+                    continue
+                self.numbers.add([start], [end], NUMBERFORMAT + unit, (position, kind, prop))
+            if kind == 'style':
+                self.styles[position] = style
+
+    def values(self, times):
+        """The interpolated values of each batch, a row per time."""
+        times = numpy.asarray(times, numpy.float64)[:, None]
+        rows = {}
+        start, end = self.numbers.arrays()
+        rows[self.numbers] = (start + (end - start) * times).tolist()
+        start, end = self.colors.arrays()
+        colors = numpy.rint(start + (end - start) * times).clip(0, 255)
+        rows[self.colors] = colors.astype(numpy.int64).tolist()
+        start, end = self.transforms.arrays()
+        start = decompose(start.reshape(-1, 6))
+        change = decompose(end.reshape(-1, 6)) - start
+        # turn the short way round
+        change[:, 2] = (change[:, 2] + math.pi) % (2 * math.pi) - math.pi
+        params = start[None, :, :] + change[None, :, :] * times[:, :, None]
+        rows[self.transforms] = recompose(params).reshape(len(times), -1).tolist()
+        return rows
+
+    def frames(self, times):
+        """Yield a copy of the children of the first sublayer for each
+        time, an eased fraction of the way from first to last."""
+        rows = self.values(times)
+        batches = [(batch, batch.texts(rows[batch])) for batch in (self.numbers, self.colors, self.transforms)]
+        for row in range(len(times)):
+            # one copy of the whole sublayer is quicker than one per child
+            children = list(copy.deepcopy(self.first))
+            nodes = [node for child in children for node in child.iter() if is_element(node)]
+            styles = dict((position, dict(style)) for position, style in self.styles.items())
+            for batch, texts in batches:
+                for (position, kind, attr), value in zip(batch.targets, texts[row]):
+                    if kind == 'style':
+                        styles[position][attr] = value
+                    else:
+                        nodes[position].set(attr, value)
+            for position, style in styles.items():
+                nodes[position].set('style', simplestyle.formatStyle(style))
+            yield children
+
+def rename(children, keyframe, frame, taken):
+    """Give the copied elements ids of their own, the keyframe number at
+    the end of an id becomes the frame number ex. arm003 to arm005."""
+    for child in children:
+        for node in child.iter():
+            if not is_element(node) or not node.get('id'):
+                continue
+            idattr = node.get('id')
+            if keyframe and idattr.endswith(keyframe):
+                base = idattr[:-len(keyframe)] + frame
+            else:
+                base = '%s-%s' % (idattr, frame)
+            idattr = base
+            n = 1
+            while idattr in taken:
+                idattr = '%s-%d' % (base, n)
+                n += 1
+            taken.add(idattr)
+            node.set('id', idattr)
@@ -22,6 +22,8 @@ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 import sys, os.path, inkex, simplestyle
 sys.path.append('/usr/share/inkscape/extensions')
+from framelayers import FrameIndex, FRAMETEXTSTYLE, read_timeline, write_timeline
+from framestream import FrameStream
 
 class HideLockSublayers(inkex.Effect):
     def __init__(self):
@@ -68,6 +70,9 @@ class HideLockSublayers(inkex.Effect):
         self.OptionParser.add_option('--showframenum', action = 'store',
                 type = 'inkbool', dest = 'showframenum', default = 'false',
                 help = 'Display the frame number')
+        self.OptionParser.add_option('--stream', action = 'store',
+                type = 'inkbool', dest = 'stream', default = 'false',
+                help = 'Edit the document while streaming it instead of loading it whole')
 
     def setlockhide(self, node, hide, lock):
         if lock:
@@ -82,65 +87,82 @@ class HideLockSublayers(inkex.Effect):
         else:
             node.set('style', 'display:inline')
 
-    def effect(self):
-        self.svg = self.document.getroot()
-        
+    def setframetext(self, node, show):
+        if node.get('style') is None:
+            # compact frames share the text style through a class
+            if show:
+                node.set('display', 'inline')
+            else:
+                node.set('display', 'none')
+        elif show:
+            node.set('style', 'display:inline;' + FRAMETEXTSTYLE)
+        else:
+            node.set('style', 'display:none;' + FRAMETEXTSTYLE)
+
+    def editframe(self, framenum, frametype, node):
+        """Apply the options to one node of a frame in the range."""
         fromframe = self.options.fromframe
         toframe = self.options.toframe
         duration = self.options.duration
-        hframe = self.options.hframe
-        lframe = self.options.lframe
-        hink = self.options.hink
-        link = self.options.link
-        hpaint = self.options.hpaint
-        lpaint = self.options.lpaint
-        hbackground = self.options.hbackground
-        lbackground = self.options.lbackground
-        hpencil = self.options.hpencil
-        lpencil = self.options.lpencil
-        showframenum = self.options.showframenum
-                
-        log = ''
-        for node in self.svg.iter():
-            tag = node.tag.split("}")[1]
-            try:
-                idattr = node.attrib['id']
-                frametype = idattr[:-3]
-                frame = idattr[-3:]
-                framenum = int(frame)
-            except:
-                continue
-            if fromframe <= framenum <= toframe:
-                if node.tag == inkex.addNS('g','svg'):
-                    if frametype == 'f':
-                        self.setlockhide(node, hframe, lframe)
-                    if frametype == 'bg':
-                        self.setlockhide(node, hbackground, lbackground)
-                    if frametype == 'paint':
-                        self.setlockhide(node, hpaint, lpaint)
-                    if frametype == 'ink':
-                        self.setlockhide(node, hink, link)
-                    if frametype == 'pencil':
-                        self.setlockhide(node, hpencil, lpencil)
-                        
-                # update frame display duration for browser preview
-                if node.tag == inkex.addNS('set','svg'):
-                    if frametype == 'init':
-                        node.set('dur', '%sms' % (duration * (framenum - 1)))
-                    if frametype == 'on':
-                        node.set('dur', '%sms' % (duration))
-                    if frametype == 'off':
-                        node.set('dur', '%sms' % ((duration * (toframe - 1)) - (duration * (framenum - 1)) + 1))
-                
-                # set frame number display
-                if node.tag == inkex.addNS('text', 'svg'):
-                    if frametype == 'frametext':
-                        if showframenum:
-                            node.set('style', 'display:inline;font-size:18px;font-style:normal;font-weight:normal;line-height:125%;letter-spacing:0px;word-spacing:0px;fill:#000000;fill-opacity:0.3;stroke:none;font-family:Sans')
-                        else:
-                            node.set('style', 'display:none;font-size:18px;font-style:normal;font-weight:normal;line-height:125%;letter-spacing:0px;word-spacing:0px;fill:#000000;fill-opacity:0.3;stroke:none;font-family:Sans')
-        #uncomment next line to see log
-        #inkex.errormsg(log)   
+        if not fromframe <= framenum <= toframe:
+            return
+        if frametype in self.hidelock:
+            hide, lock = self.hidelock[frametype]
+            self.setlockhide(node, hide, lock)
+
+        # update frame display duration for browser preview
+        elif frametype == 'init':
+            node.set('dur', '%sms' % (duration * (framenum - 1)))
+        elif frametype == 'on':
+            node.set('dur', '%sms' % (duration))
+        elif frametype == 'off':
+            node.set('dur', '%sms' % ((duration * (toframe - 1)) - (duration * (framenum - 1)) + 1))
+
+        # set frame number display
+        elif frametype == 'frametext':
+            self.setframetext(node, self.options.showframenum)
+
+    def edittimeline(self, frametype, animate):
+        # the preview timeline holds the timing of every frame in a few
+        # animates, only the frames in the range are changed
+        frames, holds = read_timeline(animate)
+        for i, frame in enumerate(frames):
+            if self.options.fromframe <= int(frame) <= self.options.toframe:
+                holds[i] = self.options.duration
+        write_timeline(animate, frametype, frames, holds)
+
+    def prepare(self):
+        options = self.options
+        self.hidelock = {'f': (options.hframe, options.lframe),
+            'bg': (options.hbackground, options.lbackground),
+            'paint': (options.hpaint, options.lpaint),
+            'ink': (options.hink, options.link),
+            'pencil': (options.hpencil, options.lpencil)}
+
+    def affect(self, args=sys.argv[1:], output=True):
+        self.getoptions(args)
+        if not self.options.stream:
+            return inkex.Effect.affect(self, args, output)
+        if output:
+            self.streamframes(self.args[-1], getattr(sys.stdout, 'buffer', sys.stdout))
+
+    def streamframes(self, source, out):
+        """Apply the options while copying the document in source to the
+        binary file out, without loading the whole document."""
+        self.prepare()
+        FrameStream(self.editframe, self.edittimeline).transform(source, out)
+
+    def effect(self):
+        self.svg = self.document.getroot()
+        self.prepare()
+
+        # only the frames in the range are visited
+        index = FrameIndex(self.svg)
+        for framenum in index.framenums(self.options.fromframe, self.options.toframe):
+            for frametype, node in index.frames[framenum].items():
+                self.editframe(framenum, frametype, node)
+        for frametype, animate in index.timeline.items():
+            self.edittimeline(frametype, animate)
 
 if __name__ == '__main__':
     effect = HideLockSublayers()
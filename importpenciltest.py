@@ -23,6 +23,9 @@ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 import sys, os.path, inkex, simplestyle
 sys.path.append('/usr/share/inkscape/extensions')
+from framelayers import FRAMETEXTSTYLE, TIMELINE, TIMELINEKINDS, read_timeline, write_timeline
+import pencilimages
+import pencilproxies
 
 class ImportPenciltest(inkex.Effect):
     def __init__(self):
@@ -58,6 +61,24 @@ class ImportPenciltest(inkex.Effect):
         self.OptionParser.add_option('--duration', action = 'store',
             type = 'float', dest = 'duration', default = '83.3',
             help = 'Display frame duration in milliseconds')
+        self.OptionParser.add_option('--compact', action = 'store',
+            type = 'inkbool', dest = 'compact', default = 'false',
+            help = 'Share styles and the background between frames')
+        self.OptionParser.add_option('--preview', action = 'store',
+            type = 'string', dest = 'preview', default = 'chain',
+            help = 'Browser preview timing, chain or timeline')
+        self.OptionParser.add_option('--dedupe', action = 'store',
+            type = 'inkbool', dest = 'dedupe', default = 'false',
+            help = 'Share one image between identical pencil test files')
+        self.OptionParser.add_option('--embedpencil', action = 'store',
+            type = 'inkbool', dest = 'embedpencil', default = 'false',
+            help = 'Embed the pencil test images in the document')
+        self.OptionParser.add_option('--proxyscale', action = 'store',
+            type = 'float', dest = 'proxyscale', default = '1.0',
+            help = 'Link pencil layers to copies scaled by this, 1 links the originals')
+        self.OptionParser.add_option('--proxydir', action = 'store',
+            type = 'string', dest = 'proxydir', default = '',
+            help = 'Directory to keep proxy images in')
 
     def unsignedLong(self, signedLongString):
         longColor = long(signedLongString)
@@ -72,6 +93,100 @@ class ImportPenciltest(inkex.Effect):
         hexColor = hexColor.rjust(6, '0')
         return '#' + hexColor.upper()
 
+    def getdefs(self, svg):
+        for defs in svg:
+            if defs.tag in (inkex.addNS('defs', 'svg'), 'defs'):
+                return defs
+        return inkex.etree.SubElement(svg, 'defs')
+
+    def getdefsnode(self, defs, tag, idattr):
+        # reuse the shared node from an earlier import
+        for node in defs:
+            if node.get('id') == idattr:
+                return node
+        return inkex.etree.SubElement(defs, tag, id=idattr)
+
+    def addshared(self, svg, svgw, svgh, bgcolor):
+        """Add the style classes and background rect shared by compact
+        frames to the document defs."""
+        defs = self.getdefs(svg)
+        style = self.getdefsnode(defs, 'style', 'framestyle')
+        style.set('type', 'text/css')
+        style.text = '.frametext{%s}.pencil{opacity:0.4}' % (FRAMETEXTSTYLE)
+        bgfill = self.getdefsnode(defs, 'rect', 'bgfill')
+        bgfill.set('width', '%d' % (svgw))
+        bgfill.set('height', '%s' % (svgh))
+        bgfill.set('style', 'fill:%s' % (bgcolor))
+
+    def probepencil(self, svg, hrefs, dedupe):
+        """Read the size, and the digest when deduplicating, of each pencil
+        test image. The files are read in parallel."""
+        docbase = svg.get(inkex.addNS('docbase', 'sodipodi')) or ''
+        paths = [pencilimages.resolve(href, docbase) for href in hrefs]
+        return list(pencilimages.imap(lambda path: pencilimages.probe(path, dedupe), paths))
+
+    def addpencilimage(self, parent, idattr, href, image, proxy=None):
+        pimage = inkex.etree.SubElement(parent, 'image', id=idattr)
+        if proxy is None:
+            pimage.set(inkex.addNS('href','xlink'), href)
+        else:
+            # keeps the full size of the source it stands in for
+            pimage.set(inkex.addNS('href','xlink'), proxy)
+            pimage.set(pencilproxies.SOURCE, href)
+        if image.size is not None:
+            pimage.set('width', '%d' % (image.size[0]))
+            pimage.set('height', '%d' % (image.size[1]))
+        return pimage
+
+    def addtimeline(self, svg, frames, duration, importpencil):
+        """Add the frames to the preview timeline layer. The layer shows
+        each sublayer kind through one <use> with a discrete animate of its
+        href so the whole preview runs on a single clock."""
+        timeline = None
+        for node in svg:
+            if node.get('id') == TIMELINE:
+                timeline = node
+        if timeline is None:
+            timeline = inkex.etree.SubElement(svg, 'g', id=TIMELINE,
+                style='display:none')
+            timeline.set(inkex.addNS('label', 'inkscape'), 'preview')
+            timeline.set(inkex.addNS('groupmode', 'inkscape'), 'layer')
+            timeline.set(inkex.addNS('insensitive', 'sodipodi'), 'true')
+            # hidden in inkscape, shown once a browser starts the animation
+            inkex.etree.SubElement(timeline, 'set',
+                attributeName='display',
+                attributeType='CSS',
+                to='inline',
+                begin='0ms',
+                fill='freeze')
+        # keep the preview above the frame layers
+        svg.append(timeline)
+        for frametype in TIMELINEKINDS:
+            animate = None
+            for use in timeline:
+                for node in use:
+                    if node.get('id') == '%s-%s' % (TIMELINE, frametype):
+                        animate = node
+            if animate is None:
+                if frametype == 'pencil' and not importpencil:
+                    continue
+                use = inkex.etree.SubElement(timeline, 'use',
+                    id='preview-%s' % (frametype))
+                use.set(inkex.addNS('href', 'xlink'), '#%s%s' % (frametype, frames[0]))
+                animate = inkex.etree.SubElement(use, 'animate',
+                    id='%s-%s' % (TIMELINE, frametype),
+                    attributeName='xlink:href',
+                    attributeType='XML',
+                    calcMode='discrete',
+                    begin='0ms',
+                    repeatCount='indefinite')
+            oldframes, oldholds = read_timeline(animate)
+            holds = dict(zip(oldframes, oldholds))
+            for frame in frames:
+                holds[frame] = duration
+            order = sorted(holds, key=int)
+            write_timeline(animate, frametype, order, [holds[frame] for frame in order])
+
     def effect(self):
         fromframe = self.options.fromframe
         toframe = self.options.toframe+1
@@ -82,6 +197,15 @@ class ImportPenciltest(inkex.Effect):
         svgh = self.options.svgh
         importpencil = self.options.importpencil
         bgcolor = self.getColorString(self.options.bgcolor)
+        compact = self.options.compact
+        preview = self.options.preview
+        dedupe = self.options.dedupe
+        embedpencil = self.options.embedpencil
+        proxyscale = self.options.proxyscale
+        proxydir = self.options.proxydir
+        useproxies = importpencil and 0 < proxyscale < 1 and pencilproxies.bimage
+        if importpencil and 0 < proxyscale < 1 and not useproxies:
+            inkex.errormsg('PIL is needed to make proxy images, linking the originals.')
 
         svg = self.document.getroot()
         # or alternatively
@@ -92,6 +216,26 @@ class ImportPenciltest(inkex.Effect):
         svg.set('height', '%s' % (svgh))
         #latest version of inkscape requires update to the viewbox as well
         svg.set('viewBox', '0 0 %s %s' % (svgw, svgh))
+        if compact:
+            self.addshared(svg, svgw, svgh, bgcolor)
+
+        if importpencil:
+            hrefs = ['%s%s%s' % (filename, format(framenum, '03d'), filetype)
+                for framenum in range(fromframe, toframe)]
+            images = self.probepencil(svg, hrefs, dedupe or useproxies)
+            proxies = [None] * len(images)
+            if useproxies:
+                if proxydir:
+                    proxydir = os.path.expandvars(os.path.expanduser(proxydir))
+                proxies = pencilproxies.build_proxies(images, proxyscale, proxydir)
+                docbase = svg.get(inkex.addNS('docbase', 'sodipodi'))
+                for n, proxy in enumerate(proxies):
+                    if proxy is not None and docbase and not os.path.isabs(hrefs[n]):
+                        # link relative to the document like the source
+                        proxies[n] = os.path.relpath(proxy, docbase)
+            # images shared by identical files, by digest
+            shared = {}
+            embeds = []
         
         for framenum in range(fromframe, toframe):
             i = format(framenum, '03d')
@@ -103,27 +247,28 @@ class ImportPenciltest(inkex.Effect):
             layer.set(inkex.addNS('groupmode', 'inkscape'), 'layer')
             
             # Add SMIL animation timing for browser preview
-            initialstate = inkex.etree.SubElement(layer, 'set',
-                id='init%s' % (i),
-                attributeName='display',
-                attributeType='CSS',
-                to='none',
-                begin='0ms; off%s.end' % (format(toframe - 1, '03d')),
-                dur='%sms' % (duration * (framenum - 1))) # the first frame displays for (duration * 0) seconds, the next frame for (duration * 1) seconds ...
-            onstate = inkex.etree.SubElement(layer, 'set',
-                id='on%s' % (i),
-                attributeName='display',
-                attributeType='CSS',
-                to='inline',
-                begin='init%s.end' % (i), # begins when intialstate ends
-                dur='%sms' % (duration)) # holds frame for 1 duration
-            offstate = inkex.etree.SubElement(layer, 'set',
-                id='off%s' % (i),
-                attributeName='display',
-                attributeType='CSS',
-                to='none',
-                begin='on%s.end' % (i), # begins when onstate ends
-                dur='%sms' % ((duration * (toframe - 1)) - (duration * (framenum - 1)) + 1))
+            if preview == 'chain':
+                initialstate = inkex.etree.SubElement(layer, 'set',
+                    id='init%s' % (i),
+                    attributeName='display',
+                    attributeType='CSS',
+                    to='none',
+                    begin='0ms; off%s.end' % (format(toframe - 1, '03d')),
+                    dur='%sms' % (duration * (framenum - 1))) # the first frame displays for (duration * 0) seconds, the next frame for (duration * 1) seconds ...
+                onstate = inkex.etree.SubElement(layer, 'set',
+                    id='on%s' % (i),
+                    attributeName='display',
+                    attributeType='CSS',
+                    to='inline',
+                    begin='init%s.end' % (i), # begins when intialstate ends
+                    dur='%sms' % (duration)) # holds frame for 1 duration
+                offstate = inkex.etree.SubElement(layer, 'set',
+                    id='off%s' % (i),
+                    attributeName='display',
+                    attributeType='CSS',
+                    to='none',
+                    begin='on%s.end' % (i), # begins when onstate ends
+                    dur='%sms' % ((duration * (toframe - 1)) - (duration * (framenum - 1)) + 1))
 
             # Create ink, paint, background, and pencil layers.
             background = inkex.etree.SubElement(layer, "g", 
@@ -131,22 +276,43 @@ class ImportPenciltest(inkex.Effect):
             background.set(inkex.addNS('label', 'inkscape'), 'background')
             background.set(inkex.addNS('groupmode', 'inkscape'), 'layer')
             background.set(inkex.addNS('insensitive', 'sodipodi'), 'true')
-            #create a rect the same size as the document and fill with the selected color
-            bgfill = inkex.etree.SubElement(background, 'rect', 
-                id='bgfill%s' % (i),
-                width='%d' % (svgw), 
-                height='%s' % (svgh),
-                style='fill:%s' % (bgcolor))
+            if compact:
+                # use the shared background rect
+                bgfill = inkex.etree.SubElement(background, 'use',
+                    id='bgfill%s' % (i))
+                bgfill.set(inkex.addNS('href', 'xlink'), '#bgfill')
+            else:
+                #create a rect the same size as the document and fill with the selected color
+                bgfill = inkex.etree.SubElement(background, 'rect', 
+                    id='bgfill%s' % (i),
+                    width='%d' % (svgw), 
+                    height='%s' % (svgh),
+                    style='fill:%s' % (bgcolor))
             if importpencil:
                 pencil = inkex.etree.SubElement(layer, 'g', 
-                    id='pencil%s' % (i),
-                    style='opacity:0.4')
+                    id='pencil%s' % (i))
+                if compact:
+                    pencil.set('class', 'pencil')
+                else:
+                    pencil.set('style', 'opacity:0.4')
                 pencil.set(inkex.addNS('label', 'inkscape'), 'pencil')
                 pencil.set(inkex.addNS('groupmode', 'inkscape'), 'layer')
                 pencil.set(inkex.addNS('insensitive', 'sodipodi'), 'true')
-                pimage = inkex.etree.SubElement(pencil, 'image', 
-                    id='pimage%s' % (i))
-                pimage.set(inkex.addNS('href','xlink'), '%s%s%s' % (filename,i,filetype))
+                href = hrefs[framenum - fromframe]
+                image = images[framenum - fromframe]
+                proxy = proxies[framenum - fromframe]
+                if dedupe and image.digest is not None:
+                    if image.digest not in shared:
+                        shared[image.digest] = self.addpencilimage(self.getdefs(svg),
+                            'pencilimage%s' % (i), href, image, proxy)
+                        embeds.append((shared[image.digest], image, proxy))
+                    pimage = inkex.etree.SubElement(pencil, 'use',
+                        id='pimage%s' % (i))
+                    pimage.set(inkex.addNS('href','xlink'), '#' + shared[image.digest].get('id'))
+                else:
+                    pimage = self.addpencilimage(pencil, 'pimage%s' % (i), href, image, proxy)
+                    if image.error is None:
+                        embeds.append((pimage, image, proxy))
             paint = inkex.etree.SubElement(layer, 'g', 
                 id='paint%s' % (i))
             paint.set(inkex.addNS('label', 'inkscape'), 'paint')
@@ -159,14 +325,37 @@ class ImportPenciltest(inkex.Effect):
             frametext = inkex.etree.SubElement(layer, 'text',
                 id='frametext%s' % (i),
                 x='0',
-                y='14',
-                style='display:none;font-size:18px;font-style:normal;font-weight:normal;line-height:125%;letter-spacing:0px;word-spacing:0px;fill:#000000;fill-opacity:0.3;stroke:none;font-family:Sans')
+                y='14')
+            if compact:
+                frametext.set('class', 'frametext')
+                frametext.set('display', 'none')
+            else:
+                frametext.set('style', 'display:none;' + FRAMETEXTSTYLE)
             frametextspan = inkex.etree.SubElement(frametext, 'tspan',
                 id='tspan%s' % (i),
                 x='0',
                 y='14')
             frametextspan.text = i
+
+        if importpencil and useproxies:
+            pencilproxies.declare_namespace(svg)
+
+        if importpencil and embedpencil:
+            # encode the files in parallel, each is set as soon as it is
+            # ready, proxies are embedded in place of their sources
+            docbase = svg.get(inkex.addNS('docbase', 'sodipodi')) or ''
+            def encode(item):
+                if item[2] is not None:
+                    return pencilimages.data_uri(pencilimages.resolve(item[2], docbase), 'image/png')
+                return pencilimages.data_uri(item[1].path, item[1].mimetype)
+            for n, uri in enumerate(pencilimages.imap(encode, embeds)):
+                embeds[n][0].set(inkex.addNS('href','xlink'), uri)
+
+        if preview == 'timeline' and fromframe < toframe:
+            self.addtimeline(svg, [format(framenum, '03d') for framenum in range(fromframe, toframe)],
+                duration, importpencil)
             
 # Create effect instance and apply it.
-effect = ImportPenciltest()
-effect.affect()
+if __name__ == '__main__':
+    effect = ImportPenciltest()
+    effect.affect()
@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+"""
+inkshell.py
+Runs frame export commands through inkscape --shell processes.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, re, json, time, socket, tempfile, threading
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+try:
+    from subprocess import Popen, PIPE
+    bsubprocess = True
+except:
+    bsubprocess = False
+
+try:
+    from multiprocessing import cpu_count
+except:
+    def cpu_count():
+        return 1
+
+INKSCAPE = 'inkscape'
+
+# where renderdaemon.py listens unless told otherwise
+DAEMONSOCKET = os.path.join(tempfile.gettempdir(),
+    'inkscape-animation-%s.sock' % (getattr(os, 'getuid', lambda: 0)()))
+
+# lines printed by the inkscape exporter for each image written
+AREALINE = re.compile(r'Area ([-\d.]+):([-\d.]+):([-\d.]+):([-\d.]+) exported to (\d+) x (\d+) pixels')
+SAVEDLINE = re.compile(r'Bitmap saved as: (.*?)\s*$')
+
+class ExportJob(object):
+    """One frame to export and the result of exporting it."""
+    def __init__(self, framenum, frame, idattr, filename, command):
+        self.framenum = framenum
+        self.frame = frame
+        self.idattr = idattr
+        self.filename = filename
+        self.command = command
+        self.ok = False
+        self.error = None
+        self.area = None
+        self.attempts = 0
+        # times the command was sent, the shell started on it, the area
+        # line and the saved line were read
+        self.issued = None
+        self.started = None
+        self.rendered = None
+        self.saved = None
+        # seconds from sending to saved, spent rendering and writing
+        self.latency = None
+        self.render = None
+        self.write = None
+        # bytes written and the shell's peak resident memory in kB
+        self.size = None
+        self.rss = None
+        self.warnings = []
+
+# per attempt results copied between jobs
+TIMINGS = ('attempts', 'issued', 'started', 'rendered', 'saved', 'latency',
+    'render', 'write', 'rss', 'warnings')
+
+def export_command(svg_file, idattr, filename, canvas=True, dpi=None):
+    """Export only idattr, over the whole page when canvas is set or
+    clipped to the object's bounding box otherwise. dpi overrides the
+    export resolution saved in the document."""
+    area = '-C '
+    if not canvas:
+        area = ''
+    resolution = ''
+    if dpi:
+        resolution = '-d %g ' % (dpi)
+    return "%s -i %s -j %s%s-e %s" % (svg_file, idattr, area, resolution, filename)
+
+def parse_area(line):
+    """The export area in an exporter line as (x0, y0, x1, y1, width, height)
+    or None. The area is in document units with the y axis pointing up
+    from the bottom of the page."""
+    match = AREALINE.search(line)
+    if match is None:
+        return None
+    return tuple([float(n) for n in match.groups()[:4]] +
+        [int(n) for n in match.groups()[4:]])
+
+def parse_areas(lines):
+    """Map each saved filename to the export area reported for it."""
+    areas = {}
+    area = None
+    for line in lines:
+        found = parse_area(line)
+        if found is not None:
+            area = found
+            continue
+        match = SAVEDLINE.search(line)
+        if match and area is not None:
+            areas[match.group(1)] = area
+            area = None
+    return areas
+
+def peak_rss(pid):
+    """Peak resident memory of a running process in kB where /proc has it."""
+    try:
+        f = open('/proc/%d/status' % (pid))
+        try:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+def drain(pipe, lines, online=None):
+    # read a pipe until the process closes it
+    for line in iter(pipe.readline, ''):
+        lines.append(line)
+        if online is not None:
+            online(line)
+    pipe.close()
+
+class ShellWorker(threading.Thread):
+    """A long-lived inkscape --shell process fed one shard of jobs.
+    Commands are streamed over stdin while stdout and stderr are read
+    by their own threads so neither pipe can fill up and stall.
+    notify is called with each job as soon as its image is saved or it
+    is known to have failed, and with the worker itself once the shell
+    has exited."""
+    def __init__(self, jobs, inkscape=INKSCAPE, notify=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.jobs = jobs
+        self.inkscape = inkscape
+        self.notify = notify
+        self.stdout = []
+        self.stderr = []
+        self.returncode = None
+        self.error = None
+        self.byfilename = dict((job.filename, job) for job in jobs)
+        self.area = None
+        self.pid = None
+        # the shell runs the commands in order, position is the job it is on
+        self.position = 0
+        self.last = None
+        self.rendered = None
+        # ids of the jobs notify was called with
+        self.reported = set()
+
+    def report(self, job):
+        self.reported.add(id(job))
+        if self.notify is not None:
+            self.notify(job)
+
+    def online(self, line):
+        # follow the exporter output to report each job when it is saved
+        now = time.time()
+        area = parse_area(line)
+        if area is not None:
+            self.area = area
+            self.rendered = now
+            return
+        match = SAVEDLINE.search(line)
+        if match and match.group(1) in self.byfilename:
+            job = self.byfilename[match.group(1)]
+            job.area = self.area
+            job.ok = os.path.isfile(job.filename)
+            # commands are queued up front, the shell starts on a job once
+            # it has saved the one before
+            job.started, job.rendered, job.saved = max(self.last, job.issued), self.rendered or now, now
+            job.render = job.rendered - job.started
+            job.write = now - job.rendered
+            job.latency = now - job.issued
+            job.rss = peak_rss(self.pid)
+            if job.ok:
+                job.size = os.path.getsize(job.filename)
+            self.area = self.rendered = None
+            self.last = now
+            self.position = self.jobs.index(job) + 1
+            if not job.ok:
+                job.error = 'no image written to %s' % (job.filename)
+            self.report(job)
+
+    def onerror(self, line):
+        # warnings belong to the job the shell is working on
+        if self.position < len(self.jobs) and line.strip():
+            self.jobs[self.position].warnings.append(line.strip())
+
+    def run(self):
+        try:
+            self.export()
+        finally:
+            if self.notify is not None:
+                self.notify(self)
+
+    def export(self):
+        started = int(time.time())
+        try:
+            ink = Popen([self.inkscape, '--shell'], shell=False,
+                stdin=PIPE, stdout=PIPE, stderr=PIPE, universal_newlines=True)
+        except OSError as e:
+            self.error = 'could not start %s: %s' % (self.inkscape, e)
+            for job in self.jobs:
+                job.error = self.error
+                self.report(job)
+            return
+        self.pid = ink.pid
+        self.last = time.time()
+        readers = [threading.Thread(target=drain, args=(ink.stdout, self.stdout, self.online)),
+            threading.Thread(target=drain, args=(ink.stderr, self.stderr, self.onerror))]
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+        try:
+            for job in self.jobs:
+                job.issued = time.time()
+                ink.stdin.write(job.command + '\n')
+                ink.stdin.flush()
+            ink.stdin.write('quit\n')
+            ink.stdin.close()
+        except (IOError, OSError) as e:
+            # the shell exited early, the remaining jobs are marked below
+            self.error = 'inkscape shell closed: %s' % (e)
+        self.returncode = ink.wait()
+        for reader in readers:
+            reader.join()
+        if self.returncode and self.error is None:
+            self.error = 'inkscape exited with status %s' % (self.returncode)
+        areas = parse_areas(self.stdout)
+        for job in self.jobs:
+            if id(job) in self.reported:
+                continue
+            job.area = areas.get(job.filename)
+            if os.path.isfile(job.filename) and os.path.getmtime(job.filename) >= started:
+                job.ok = True
+                job.size = os.path.getsize(job.filename)
+            else:
+                job.error = self.error or 'no image written to %s' % (job.filename)
+            self.report(job)
+
+    def log(self):
+        return ''.join(self.stdout) + ''.join(self.stderr)
+
+def daemon_request(path, lines, timeout=None):
+    """Connect to the render daemon, send lines and return the socket and
+    a reader of its reply lines."""
+    if not hasattr(socket, 'AF_UNIX'):
+        raise socket.error('unix sockets are not available')
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(path)
+        connection.sendall(''.join(line + '\n' for line in lines).encode('utf-8'))
+    except:
+        connection.close()
+        raise
+    return connection, connection.makefile('r')
+
+def daemon_status(path):
+    """The status reported by a running render daemon or None."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        connection, replies = daemon_request(path, ['status'], 5)
+        try:
+            return json.loads(replies.readline())
+        finally:
+            replies.close()
+            connection.close()
+    except (socket.error, ValueError):
+        return None
+
+class DaemonWorker(ShellWorker):
+    """Hands the jobs to a running render daemon instead of starting an
+    inkscape shell. Jobs the daemon does not finish, because it went away,
+    are exported by a shell of our own."""
+    def __init__(self, jobs, path, inkscape=INKSCAPE, notify=None):
+        ShellWorker.__init__(self, jobs, inkscape, notify)
+        self.path = path
+        self.queue = None
+
+    def export(self):
+        try:
+            self.export_daemon()
+        except (socket.error, IOError, ValueError) as e:
+            self.stderr.append('render daemon: %s\n' % (e))
+        remaining = [job for job in self.jobs if not job.ok]
+        if remaining:
+            local = ShellWorker(remaining, self.inkscape, self.notify)
+            local.export()
+            self.stdout.extend(local.stdout)
+            self.stderr.extend(local.stderr)
+
+    def export_daemon(self):
+        issued = time.time()
+        for job in self.jobs:
+            job.issued = issued
+        connection, replies = daemon_request(self.path,
+            ['job ' + job.command for job in self.jobs] + ['end'])
+        try:
+            for line in iter(replies.readline, ''):
+                reply = json.loads(line)
+                if reply.get('done'):
+                    self.queue = reply.get('queue')
+                    break
+                job = self.jobs[reply['index']]
+                job.error = reply.get('error')
+                job.latency = reply.get('latency')
+                job.render = reply.get('render')
+                job.saved = time.time()
+                job.rss = reply.get('rss')
+                job.warnings.extend(line.strip() for line in reply.get('errors', []) if line.strip())
+                if reply.get('area'):
+                    job.area = tuple(reply['area'])
+                self.stdout.append('%s latency:%.3fs render:%.3fs queue:%s\n' % (job.idattr,
+                    job.latency or 0, job.render or 0, reply.get('queue')))
+                self.stdout.extend(reply.get('output', []))
+                if reply.get('ok'):
+                    job.ok = True
+                    job.size = os.path.getsize(job.filename)
+                    # failed jobs are reported by the shell that retries them
+                    self.report(job)
+        finally:
+            replies.close()
+            connection.close()
+
+def make_workers(jobs, workers, inkscape, notify=None, daemon=None):
+    # with the daemon each shard is a connection of its own, the daemon's
+    # shells render the queued jobs of all of them
+    if daemon:
+        return [DaemonWorker(part, daemon, inkscape, notify) for part in shard(jobs, workers)]
+    return [ShellWorker(part, inkscape, notify) for part in shard(jobs, workers)]
+
+def shard(jobs, workers):
+    """Split jobs across workers. Frames are dealt out in turn so that a
+    run of heavy frames is shared instead of landing on one worker."""
+    if workers < 1:
+        workers = cpu_count()
+    workers = min(workers, len(jobs))
+    return [jobs[i::workers] for i in range(workers)]
+
+def attempt(jobs):
+    for job in jobs:
+        job.attempts += 1
+        job.error = None
+        del job.warnings[:]
+
+def export(jobs, workers=1, inkscape=INKSCAPE, daemon=None, retries=0, progress=None):
+    """Export the jobs using up to workers inkscape shells in parallel or
+    up to workers connections to the render daemon listening on the
+    daemon socket path. Failed jobs are exported again up to retries
+    times and progress is called with each job as it is saved or fails,
+    so a job that is retried can be reported failed and then saved.
+    Returns the finished ShellWorker list, each job records its own ok
+    flag and error."""
+    notify = None
+    if progress is not None:
+        notify = lambda item: isinstance(item, ExportJob) and progress(item)
+    shells = []
+    while jobs:
+        attempt(jobs)
+        running = make_workers(jobs, workers, inkscape, notify, daemon)
+        for shell in running:
+            shell.start()
+        for shell in running:
+            shell.join()
+        shells.extend(running)
+        jobs = [job for job in jobs if not job.ok]
+        if retries < 1:
+            break
+        retries -= 1
+    return shells
+
+def export_iter(jobs, workers=1, inkscape=INKSCAPE, daemon=None, retries=0, progress=None):
+    """Export the jobs like export but yield each job, in order, as soon
+    as it and every job before it are finished. Failed jobs are yielded
+    too with ok unset once their shell has exited and the retries are
+    used up."""
+    done = Queue()
+    shells = make_workers(jobs, workers, inkscape, done.put, daemon)
+    attempt(jobs)
+    for shell in shells:
+        shell.start()
+    running = len(shells)
+    ready = set()
+    position = 0
+    while position < len(jobs):
+        if running == 0 and retries > 0:
+            # every shell is done, export what failed again before
+            # giving up on it
+            export([job for job in jobs[position:] if not job.ok], workers,
+                inkscape, daemon, retries - 1, progress)
+            retries = 0
+        while position < len(jobs) and (running == 0 or id(jobs[position]) in ready):
+            yield jobs[position]
+            position += 1
+        if position < len(jobs):
+            finished = done.get()
+            if isinstance(finished, ShellWorker):
+                finished.join()
+                running -= 1
+            else:
+                # failed jobs wait for the retries
+                if finished.ok:
+                    ready.add(id(finished))
+                if progress is not None:
+                    progress(finished)
+    for shell in shells:
+        shell.join()
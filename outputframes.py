@@ -20,15 +20,18 @@ You should have received a copy of the GNU General Public License
 along with this program; if not, write to the Free Software
 Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
-import sys, os, inkex, simplestyle
+import sys, os, time, shutil, tempfile, inkex, simplestyle
 sys.path.append('/usr/share/inkscape/extensions')
-from cStringIO import StringIO
-
-try:
-    from subprocess import Popen, PIPE
-    bsubprocess = True
-except:
-    bsubprocess = False
+from framelayers import FrameIndex
+import inkshell
+from inkshell import ExportJob, export_command
+import framemanifest
+import framecomposite
+import frameanim
+import pencilproxies
+import framereport
+import framescale
+import pencilimages
 
 class OutputFrames(inkex.Effect):
     def __init__(self):
@@ -48,16 +51,127 @@ class OutputFrames(inkex.Effect):
         self.OptionParser.add_option("--hpencil", action="store", 
             type="inkbool", dest="hpencil", default="true",
             help="Hide pencil sublayer during export?")
+        self.OptionParser.add_option("--workers", action="store",
+            type="int", dest="workers", default="1",
+            help="Number of inkscape processes to export with (0 for one per CPU)")
+        self.OptionParser.add_option("--scales", action="store",
+            type="string", dest="scales", default="",
+            help="Comma separated output scales ex. 0.5,1,2, rendered once at the largest")
+        self.OptionParser.add_option("--incremental", action="store",
+            type="inkbool", dest="incremental", default="false",
+            help="Only export frames that changed since the last export")
+        self.OptionParser.add_option("--sharedbg", action="store",
+            type="inkbool", dest="sharedbg", default="false",
+            help="Render identical backgrounds once and composite the frames over them")
+        self.OptionParser.add_option("--animformat", action="store",
+            type="string", dest="animformat", default="png",
+            help="png for an image per frame, apng, gif or y4m for one animation file or atlas for sprite sheets")
+        self.OptionParser.add_option("--animfile", action="store",
+            type="string", dest="animfile", default="",
+            help="Animation file or named pipe to write to, defaults to the image name in the directory")
+        self.OptionParser.add_option("--atlassize", action="store",
+            type="int", dest="atlassize", default="2048",
+            help="Largest sprite sheet page width and height in pixels")
+        self.OptionParser.add_option("--daemon", action="store",
+            type="inkbool", dest="daemon", default="true",
+            help="Export through a running renderdaemon.py when one is listening")
+        self.OptionParser.add_option("--socket", action="store",
+            type="string", dest="socket", default="",
+            help="Unix socket of the render daemon, defaults to one per user in the temp directory")
+        self.OptionParser.add_option("--retries", action="store",
+            type="int", dest="retries", default="1",
+            help="Times to export a failed frame again")
+        self.OptionParser.add_option("--report", action="store",
+            type="string", dest="report", default="",
+            help="Write frame timings, sizes and memory use to this .json or .csv file")
+        self.OptionParser.add_option("--progress", action="store",
+            type="inkbool", dest="progress", default="false",
+            help="Print a line to stderr as each frame is saved")
 
     def check_dir_exists(self, dir):
         if not os.path.isdir(dir):
             os.makedirs(dir)
             
     def sethide(self, node, hide):
+        """Show or hide node, returns whether its style changed."""
+        style = node.get('style')
         if hide:
             node.set('style', 'display:none')
         else:
             node.set('style', 'display:inline')
+        return node.get('style') != style
+
+    def write_copy(self, svg_file):
+        """Write the document to a temporary file for the shells, next to
+        svg_file so relative links still resolve, or in the temp directory
+        when that is not writable."""
+        directory = os.path.dirname(os.path.abspath(svg_file))
+        try:
+            handle, path = tempfile.mkstemp(suffix='.svg', prefix='.outputframes', dir=directory)
+        except (IOError, OSError):
+            handle, path = tempfile.mkstemp(suffix='.svg', prefix='outputframes')
+        f = os.fdopen(handle, 'wb')
+        try:
+            self.document.write(f)
+        finally:
+            f.close()
+        return path
+
+    def export_animation(self, index, jobs, workers, animformat, animfile, atlassize,
+            daemon=None, retries=0, progress=None):
+        # each frame is encoded as soon as it and the frames before it
+        # are rendered, then its image is removed
+        durations = [index.duration(job.framenum, 83.3) for job in jobs]
+        try:
+            writer = frameanim.writer(animformat, animfile, durations, atlassize)
+        except (ValueError, IOError, OSError) as e:
+            inkex.errormsg('Could not write %s: %s' % (animfile, e))
+            return
+        failed = []
+        try:
+            for i, job in enumerate(inkshell.export_iter(jobs, workers, daemon=daemon,
+                    retries=retries, progress=progress)):
+                if job.ok:
+                    try:
+                        writer.add(job.filename, durations[i])
+                    except (ValueError, IOError) as e:
+                        job.error = str(e)
+                        failed.append(job)
+                    os.remove(job.filename)
+                else:
+                    failed.append(job)
+        finally:
+            try:
+                writer.close()
+            except (ValueError, IOError, OSError) as e:
+                inkex.errormsg('Could not write %s: %s' % (animfile, e))
+        if failed:
+            inkex.errormsg('%d of %d frames are missing from %s:\n%s' % (len(failed), len(jobs),
+                animfile, '\n'.join('%s: %s' % (job.idattr, job.error) for job in failed)))
+
+    def derive_scales(self, jobs, dirname, scales, workers):
+        """Write the frames rendered at the largest scale at each of the
+        smaller scales."""
+        def derive(job):
+            targets = [(os.path.join(framescale.scale_dir(dirname, scale),
+                os.path.basename(job.filename)), scale / scales[-1]) for scale in scales[:-1]]
+            try:
+                framescale.derive(job.filename, targets)
+            except (IOError, OSError, ValueError) as e:
+                job.ok = False
+                job.error = 'could not scale %s: %s' % (job.filename, e)
+        for result in pencilimages.imap(derive, [job for job in jobs if job.ok], workers):
+            pass
+
+    def write_report(self, dirname, jobs, started, shells, skipped):
+        if not self.options.report:
+            return
+        # a report name without a directory goes next to the images
+        report = os.path.join(dirname, os.path.expandvars(os.path.expanduser(self.options.report)))
+        try:
+            framereport.write_report(report, jobs, started, shells, skipped)
+        except (IOError, OSError) as e:
+            inkex.errormsg('Could not write the report %s: %s' % (report, e))
 
     def effect(self):
         self.svg = self.document.getroot()
@@ -68,48 +182,157 @@ class OutputFrames(inkex.Effect):
         dirname = os.path.dirname(self.options.directory)
         image = self.options.image
         hpencil = self.options.hpencil
+        workers = self.options.workers
+        incremental = self.options.incremental
+        sharedbg = self.options.sharedbg
+        animformat = self.options.animformat
+        animfile = self.options.animfile
+        atlassize = self.options.atlassize
+        retries = self.options.retries
+        try:
+            scales = framescale.parse_scales(self.options.scales)
+        except ValueError as e:
+            inkex.errormsg('Could not read the output scales: %s' % (e))
+            return
+        started = time.time()
+        daemon = None
+        if self.options.daemon:
+            daemon = os.path.expanduser(self.options.socket or inkshell.DAEMONSOCKET)
+            if inkshell.daemon_status(daemon) is None:
+                daemon = None
         
         if dirname == '' or dirname == None:
             dirname = './'
         dirname = os.path.expanduser(dirname)
         dirname = os.path.expandvars(dirname)
         #self.check_dir_exists(dirname)
-        commands = StringIO()
+        framedir = dirname
+        if animformat != 'png':
+            # frames only pass through a temporary directory on their way
+            # into the animation
+            incremental = sharedbg = False
+            if not animfile:
+                animfile = os.path.join(dirname, image + frameanim.EXTENSIONS.get(animformat, ''))
+            animfile = os.path.expandvars(os.path.expanduser(animfile))
+            framedir = tempfile.mkdtemp(prefix='outputframes')
+            if scales:
+                inkex.errormsg('Output scales only apply to PNG frames, exporting at the document size.')
+                scales = []
+        if len(scales) > 1 and not framescale.bnumpy:
+            inkex.errormsg('numpy and PIL are needed to export several scales.')
+            return
+        dpi = None
+        if scales:
+            # frames are rendered at the largest scale into its directory
+            # and the other scales are made from them
+            for scale in scales:
+                self.check_dir_exists(framescale.scale_dir(dirname, scale))
+            framedir = framescale.scale_dir(dirname, scales[-1])
+            dpi = framescale.document_dpi(self.svg) * scales[-1]
+        if daemon:
+            # the daemon runs in its own working directory
+            svg_file = os.path.abspath(svg_file)
+            framedir = os.path.abspath(framedir)
+        jobs = []
         log = ''
+        skipped = 0
+        progress = None
+        if self.options.progress:
+            progress = framereport.Progress(0)
         
-        # iterate through the xml whenever the layer name is between
-        # fromframe and toframe then edit the xml
-        for node in self.svg.iter():
-            tag = node.tag.split("}")[1]
-            if node.tag == inkex.addNS('g','svg'):
-                idattr = node.attrib['id']
-                frametype = idattr[:-3]
-                frame = idattr[-3:]
+        # look up the frame layers between fromframe and toframe
+        # then edit the xml
+        index = FrameIndex(self.svg)
+        relinked = []
+        if not hpencil:
+            # pencil layers are exported from their full resolution
+            # sources, linked in a copy of the document
+            relinked = pencilproxies.relink(index, fromframe, toframe)
+        # the shells export a copy of the document as edited here, the
+        # file on disk keeps its pencil layers and links
+        edited = bool(relinked)
+        copy_file = None
+        try:
+            for framenum in index.framenums(fromframe, toframe):
+                frame = index.frame(framenum)
+                node = index.get(framenum, 'f')
+                if node is not None:
+                    idattr = node.get('id')
+                    log += 'idattr:%s type:%s frame:%s\n' % (idattr, 'f', frame)
+                    edited = self.sethide(node, False) or edited
+                    filename = framedir + os.path.sep + image + frame + ".png"
+                    jobs.append(ExportJob(framenum, frame, idattr, filename, None))
+                node = index.get(framenum, 'pencil')
+                if node is not None:
+                    edited = self.sethide(node, hpencil) or edited
+            if edited:
+                copy_file = self.write_copy(svg_file)
+                svg_file = copy_file
+            for job in jobs:
+                job.command = export_command(svg_file, job.idattr, job.filename, dpi=dpi)
+            if incremental:
+                # skip frames whose digest matches the manifest from the last
+                # export and whose image is still there
+                manifestfile = framemanifest.manifest_path(dirname, image)
+                manifest = framemanifest.load_manifest(manifestfile)
+                digests = framemanifest.FrameDigest(self.svg, '-j -C hpencil=%s scales=%s dpi=%s' % (
+                    hpencil, ','.join('%g' % (scale) for scale in scales), dpi))
+                changed = []
+                for job in jobs:
+                    job.digest = digests.digest(index.get(job.framenum, 'f'))
+                    entry = manifest.get(job.frame, {})
+                    written = [job.filename] + [os.path.join(framescale.scale_dir(dirname, scale),
+                        os.path.basename(job.filename)) for scale in scales[:-1]]
+                    if entry.get('digest') == job.digest and all(os.path.isfile(path) for path in written):
+                        log += 'unchanged:%s\n' % (job.idattr)
+                    else:
+                        changed.append(job)
+                skipped = len(jobs) - len(changed)
+                jobs = changed
+            if not inkshell.bsubprocess:
+                inkex.errormsg('The subprocess module is needed to export frames.')
+                return
+            if progress is not None:
+                progress.expect(len(jobs))
+            if animformat != 'png':
                 try:
-                    framenum = int(frame)
-                except:
-                    continue
-                log += 'idattr:%s type:%s frame:%s\n' % (idattr, frametype, frame)
-                if fromframe <= framenum <= toframe:
-                    if frametype == 'f':
-                        self.sethide(node, False)
-                        filename = dirname + os.path.sep + image + frame + ".png"
-                        commands.write("%s -i %s -j -C -e %s\n" % (svg_file, idattr, filename))
-                    if frametype == 'pencil':
-                        self.sethide(node, hpencil)
-        #TODO frames not being set to show
-        commands.write("quit\n")
-        if bsubprocess:
-            echo = Popen(['echo', commands.getvalue()], shell=False, stdout=PIPE)
-            ink = Popen(['inkscape', '--shell'], shell=False, stdin=echo.stdout, stdout=PIPE, stderr=PIPE)
-        else:
-			#reference: http://stackoverflow.com/questions/7442665/convert-svg-file-to-multiple-different-size-png-files
-            _, ink, err = os.open3('inkscape --shell <<COMMANDS\n%sCOMMANDS' % (commands))
-            ink.close()
-        stdoutdata, stderrdata = ink.communicate()
-        log += stdoutdata
-        #uncomment next line to see log
-        #inkex.errormsg(log + commands.getvalue())
+                    self.export_animation(index, jobs, workers, animformat, animfile, atlassize,
+                        daemon, retries, progress)
+                finally:
+                    shutil.rmtree(framedir, ignore_errors=True)
+                self.write_report(dirname, jobs, started, (), skipped)
+                return
+            if sharedbg and not framecomposite.bnumpy:
+                inkex.errormsg('numpy and PIL are needed to composite backgrounds, exporting whole frames.')
+                sharedbg = False
+            if sharedbg:
+                shells = framecomposite.export_composite(self.document, index, jobs, workers,
+                    daemon, retries, progress, dpi)
+            else:
+                shells = inkshell.export(jobs, workers, daemon=daemon, retries=retries,
+                    progress=progress)
+            if len(scales) > 1:
+                self.derive_scales(jobs, dirname, scales, workers)
+            for shell in shells:
+                log += shell.log()
+            failed = [job for job in jobs if not job.ok]
+            if incremental:
+                for job in jobs:
+                    if job.ok:
+                        manifest[job.frame] = {'digest': job.digest,
+                            'file': os.path.basename(job.filename)}
+                framemanifest.save_manifest(manifestfile, manifest)
+            self.write_report(dirname, jobs, started, shells, skipped)
+            if failed:
+                inkex.errormsg('%d of %d frames failed to export:\n%s' % (len(failed), len(jobs),
+                    '\n'.join('%s: %s' % (job.idattr, job.error) for job in failed)))
+            #uncomment next line to see log
+            #inkex.errormsg(log + '\n'.join(job.command for job in jobs))
+        finally:
+            if relinked:
+                pencilproxies.restore(relinked)
+            if copy_file is not None and os.path.exists(copy_file):
+                os.remove(copy_file)
 
 if __name__ == '__main__':
     e = OutputFrames()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+pencilimages.py
+Probes, hashes and embeds the pencil test images linked by
+importpenciltest.py.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, struct, base64, hashlib
+
+try:
+    from multiprocessing.pool import ThreadPool
+    from multiprocessing import cpu_count
+    bpool = True
+except:
+    bpool = False
+
+# files are read this many bytes at a time, a multiple of 3 so the
+# base64 of each chunk can be joined without padding in between
+CHUNKSIZE = 3 * 256 * 1024
+
+PNGSIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# jpeg start of frame markers hold the image size
+JPEGSOF = (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+
+class PencilImage(object):
+    """What is known about one pencil test image file."""
+    def __init__(self, path):
+        self.path = path
+        self.digest = None
+        self.size = None
+        self.mimetype = None
+        self.error = None
+
+def resolve(href, docbase=''):
+    # links are relative to the document like they are in inkscape
+    return os.path.join(docbase or '', os.path.expanduser(href))
+
+def read_header(f):
+    """(mimetype, (width, height)) from the start of a png or jpeg file
+    without reading the image data, or (None, None)."""
+    head = f.read(26)
+    if head[:8] == PNGSIGNATURE and head[12:16] == b'IHDR':
+        return 'image/png', struct.unpack('>II', head[16:24])
+    if head[:2] != b'\xff\xd8':
+        return None, None
+    # walk the jpeg segments until a start of frame
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0:1] != b'\xff':
+            return 'image/jpeg', None
+        code = ord(marker[1:2])
+        if code == 0xFF:
+            f.seek(-1, 1)
+            continue
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        length = f.read(2)
+        if len(length) < 2:
+            return 'image/jpeg', None
+        length, = struct.unpack('>H', length)
+        if code in JPEGSOF:
+            data = f.read(5)
+            if len(data) < 5:
+                return 'image/jpeg', None
+            height, width = struct.unpack('>HH', data[1:5])
+            return 'image/jpeg', (width, height)
+        f.seek(length - 2, 1)
+
+def probe(path, digest=True):
+    """Read the size from the header of path and, with digest set, hash
+    the file contents."""
+    image = PencilImage(path)
+    try:
+        f = open(path, 'rb')
+        try:
+            image.mimetype, image.size = read_header(f)
+            if digest:
+                f.seek(0)
+                sha = hashlib.sha1()
+                for data in iter(lambda: f.read(CHUNKSIZE), b''):
+                    sha.update(data)
+                image.digest = sha.hexdigest()
+        finally:
+            f.close()
+    except (IOError, OSError) as e:
+        image.error = str(e)
+    return image
+
+def data_uri(path, mimetype=None):
+    """The file as a base64 data uri, encoded a chunk at a time."""
+    parts = ['data:%s;base64,' % (mimetype or 'application/octet-stream')]
+    f = open(path, 'rb')
+    try:
+        for data in iter(lambda: f.read(CHUNKSIZE), b''):
+            parts.append(base64.b64encode(data).decode('ascii'))
+    finally:
+        f.close()
+    return ''.join(parts)
+
+def imap(function, items, workers=0):
+    """Map function over items in order, reading files from several
+    threads when the pool is available."""
+    if not bpool or len(items) < 2:
+        for item in items:
+            yield function(item)
+        return
+    if workers < 1:
+        workers = cpu_count()
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        for result in pool.imap(function, items):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+pencilproxies.py
+Low resolution proxies of the pencil test images for editing, swapped
+back to the full resolution files for export.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, inkex
+import pencilimages
+
+try:
+    from PIL import Image
+    bimage = True
+except:
+    bimage = False
+
+try:
+    from multiprocessing import Pool, cpu_count, current_process
+    from multiprocessing.pool import ThreadPool
+    bpool = True
+except:
+    bpool = False
+
+# proxy images remember the file they stand in for
+ANIMATIONNS = 'http://nathanjent.com/namespaces/animation'
+SOURCE = '{%s}source' % (ANIMATIONNS)
+try:
+    inkex.etree.register_namespace('animation', ANIMATIONNS)
+except AttributeError:
+    # older lxml picks its own prefix
+    pass
+
+def declare_namespace(svg):
+    """Declare the animation namespace once on the document root instead
+    of on every image lxml gave a source attribute."""
+    try:
+        inkex.etree.cleanup_namespaces(svg, top_nsmap={'animation': ANIMATIONNS},
+            keep_ns_prefixes=[prefix for prefix in svg.nsmap if prefix])
+    except TypeError:
+        # lxml before 3.5, the images declare it themselves
+        pass
+
+# proxies are kept next to the source images unless a directory is given
+PROXYDIR = '.proxies'
+
+def proxy_path(cachedir, image, scale):
+    """Cache file for a proxy of image, named by the source digest and
+    modification time so an edited source gets a new proxy."""
+    mtime = int(os.path.getmtime(image.path))
+    return os.path.join(cachedir, '%s-%d-%g.png' % (image.digest, mtime, scale))
+
+def make_proxy(args):
+    # runs in a worker process, returns the proxy path or None
+    source, target, scale = args
+    if os.path.isfile(target):
+        return target
+    try:
+        image = Image.open(source)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        size = (max(int(round(image.size[0] * scale)), 1),
+            max(int(round(image.size[1] * scale)), 1))
+        resample = getattr(Image, 'LANCZOS', None) or getattr(Image, 'ANTIALIAS')
+        proxy = image.resize(size, resample)
+        # write then rename so a parallel import never reads half a file
+        tmp = '%s.%d.tmp' % (target, os.getpid())
+        proxy.save(tmp, 'PNG')
+        if os.path.exists(target):
+            os.remove(tmp)
+        else:
+            os.rename(tmp, target)
+    except (IOError, OSError):
+        return None
+    return target
+
+def build_proxies(images, scale, cachedir=None, workers=0):
+    """Proxy paths for each pencilimages.PencilImage, None where no proxy
+    could be made. Missing proxies are made in a process pool, or in
+    threads when this is already a pool worker, ex. under batchframes.py."""
+    tasks = []
+    for image in images:
+        if image.error is not None or image.digest is None:
+            tasks.append(None)
+            continue
+        directory = cachedir or os.path.join(os.path.dirname(image.path), PROXYDIR)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tasks.append((image.path, proxy_path(directory, image, scale), scale))
+    todo = [task for task in tasks if task is not None and not os.path.isfile(task[1])]
+    if todo:
+        if bpool and len(todo) > 1:
+            if workers < 1:
+                workers = cpu_count()
+            if current_process().daemon:
+                # pool workers are not allowed processes of their own
+                pool = ThreadPool(min(workers, len(todo)))
+            else:
+                pool = Pool(min(workers, len(todo)))
+            try:
+                pool.map(make_proxy, todo)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for task in todo:
+                make_proxy(task)
+    return [task is not None and os.path.isfile(task[1]) and task[1] or None for task in tasks]
+
+def defs_images(svg):
+    """The images in the document defs by id, where deduplicated pencil
+    layers point their <use> at."""
+    images = {}
+    for defs in svg:
+        if defs.tag not in (inkex.addNS('defs', 'svg'), 'defs'):
+            continue
+        for node in defs.iter(inkex.addNS('image', 'svg'), 'image'):
+            if node.get('id') is not None:
+                images[node.get('id')] = node
+    return images
+
+def pencil_image(index, framenum, images):
+    """The image element shown in a frame's pencil sublayer, following a
+    <use> into images, the defs images by id."""
+    node = index.get(framenum, 'pimage')
+    if node is None:
+        return None
+    href = node.get(inkex.addNS('href', 'xlink')) or ''
+    if node.tag in (inkex.addNS('use', 'svg'), 'use') and href.startswith('#'):
+        return images.get(href[1:])
+    return node
+
+def relink(index, fromframe, toframe):
+    """Point the pencil images of the frames in the range at their full
+    resolution sources. Returns what restore needs to undo it."""
+    docbase = index.svg.get(inkex.addNS('docbase', 'sodipodi')) or ''
+    href = inkex.addNS('href', 'xlink')
+    relinked = []
+    seen = set()
+    images = defs_images(index.svg)
+    for framenum in index.framenums(fromframe, toframe):
+        node = pencil_image(index, framenum, images)
+        if node is None or node.get(SOURCE) is None:
+            continue
+        # deduplicated images are shared by several frames, lxml hands out
+        # a new proxy object for each lookup so they are told apart by id
+        key = node.get('id') or id(node)
+        if key in seen:
+            continue
+        seen.add(key)
+        relinked.append((node, node.get(href)))
+        # absolute so the link works from a copy of the document
+        node.set(href, os.path.abspath(pencilimages.resolve(node.get(SOURCE), docbase)))
+    return relinked
+
+def restore(relinked):
+    href = inkex.addNS('href', 'xlink')
+    for node, proxy in reversed(relinked):
+        node.set(href, proxy)
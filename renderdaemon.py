@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""
+renderdaemon.py
+Keeps inkscape --shell processes running behind a unix socket so frame
+exports do not pay the inkscape start up time on every run.
+It is part of the Inkscape animation extension
+
+Start it from a terminal and leave it running, outputframes.py uses it
+when it is listening and starts its own shells otherwise:
+
+    python renderdaemon.py --socket /tmp/inkscape-animation.sock --idle 600
+
+Clients send one "job <shell command>" line per export followed by "end"
+and get back one json line per job as it finishes, then a line with
+"done" set. A "status" line gets the queue depth and job counts.
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import os, sys, json, time, socket, optparse, threading
+from subprocess import Popen, PIPE
+import inkshell
+from inkshell import INKSCAPE, DAEMONSOCKET, SAVEDLINE, drain, parse_area
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+# the shell prints this when it is ready for the next command
+PROMPT = '>'
+
+class ShellSession(object):
+    """One inkscape --shell process run a command at a time, each command
+    is finished when the shell prompts again."""
+    def __init__(self, inkscape=INKSCAPE):
+        self.inkscape = inkscape
+        self.ink = None
+        self.stderr = []
+
+    def start(self):
+        self.ink = Popen([self.inkscape, '--shell'], shell=False,
+            stdin=PIPE, stdout=PIPE, stderr=PIPE, universal_newlines=True)
+        self.stderr = []
+        reader = threading.Thread(target=drain, args=(self.ink.stderr, self.stderr))
+        reader.daemon = True
+        reader.start()
+        # skip the banner
+        self.read_prompt()
+
+    def alive(self):
+        return self.ink is not None and self.ink.poll() is None
+
+    def read_prompt(self):
+        """Shell output up to the next prompt, raises IOError when the
+        shell exits first."""
+        output = []
+        fd = self.ink.stdout.fileno()
+        while True:
+            data = os.read(fd, 4096)
+            if not data:
+                raise IOError('inkscape shell exited')
+            output.append(data.decode('utf-8', 'replace'))
+            if output[-1].endswith(PROMPT):
+                return ''.join(output)[:-len(PROMPT)]
+
+    def run(self, command):
+        if not self.alive():
+            self.start()
+        del self.stderr[:]
+        self.ink.stdin.write(command + '\n')
+        self.ink.stdin.flush()
+        return self.read_prompt()
+
+    def close(self):
+        if self.alive():
+            try:
+                self.ink.stdin.write('quit\n')
+                self.ink.stdin.close()
+            except (IOError, OSError):
+                pass
+            self.ink.wait()
+
+class Job(object):
+    def __init__(self, index, command, replies):
+        self.index = index
+        self.command = command
+        self.replies = replies
+        self.queued = time.time()
+
+class RenderDaemon(object):
+    """Accepts clients on a unix socket and feeds their jobs through a
+    shared queue to the shell sessions. Exits after idle seconds without
+    a client or a job, or when stopped if idle is None."""
+    def __init__(self, path, shells=1, idle=600, inkscape=INKSCAPE):
+        self.path = path
+        self.idle = idle
+        self.jobs = Queue()
+        self.sessions = [ShellSession(inkscape) for i in range(max(shells, 1))]
+        self.lock = threading.Lock()
+        self.clients = 0
+        self.busy = 0
+        self.done = 0
+        self.failed = 0
+        self.last = time.time()
+        self.running = True
+
+    def status(self):
+        return {'queue': self.jobs.qsize(), 'busy': self.busy, 'clients': self.clients,
+            'shells': len(self.sessions), 'done': self.done, 'failed': self.failed,
+            'idle': round(time.time() - self.last, 3), 'pid': os.getpid()}
+
+    def render(self, session):
+        while self.running:
+            try:
+                job = self.jobs.get(timeout=1)
+            except Empty:
+                continue
+            with self.lock:
+                self.busy += 1
+            started = time.time()
+            reply = {'index': job.index, 'ok': False}
+            try:
+                output = session.run(job.command)
+                reply['output'] = output.splitlines(True)
+                reply['errors'] = list(session.stderr)
+                reply['rss'] = inkshell.peak_rss(session.ink.pid)
+                for line in reply['output']:
+                    area = parse_area(line)
+                    if area is not None:
+                        reply['area'] = area
+                    match = SAVEDLINE.search(line)
+                    if match and os.path.isfile(match.group(1)):
+                        reply['ok'] = True
+                if not reply['ok']:
+                    reply['error'] = 'no image written for %s' % (job.command)
+            except (IOError, OSError) as e:
+                reply['error'] = 'inkscape shell: %s' % (e)
+                session.close()
+            finished = time.time()
+            reply['render'] = round(finished - started, 4)
+            reply['latency'] = round(finished - job.queued, 4)
+            reply['queue'] = self.jobs.qsize()
+            with self.lock:
+                self.busy -= 1
+                self.last = finished
+                if reply['ok']:
+                    self.done += 1
+                else:
+                    self.failed += 1
+            job.replies.put(reply)
+
+    def serve(self, connection):
+        requests = connection.makefile('r')
+        replies = Queue()
+        jobs = 0
+        try:
+            for line in iter(requests.readline, ''):
+                line = line.strip()
+                if line == 'status':
+                    connection.sendall((json.dumps(self.status()) + '\n').encode('utf-8'))
+                elif line.startswith('job '):
+                    self.jobs.put(Job(jobs, line[4:], replies))
+                    jobs += 1
+                elif line == 'end':
+                    break
+            for i in range(jobs):
+                connection.sendall((json.dumps(replies.get()) + '\n').encode('utf-8'))
+            if jobs:
+                connection.sendall((json.dumps({'done': True,
+                    'queue': self.jobs.qsize()}) + '\n').encode('utf-8'))
+        except socket.error:
+            # the client went away, its queued jobs still run
+            pass
+        finally:
+            requests.close()
+            connection.close()
+            with self.lock:
+                self.clients -= 1
+                self.last = time.time()
+
+    def stop(self):
+        # run returns within a second
+        self.running = False
+
+    def run(self):
+        if os.path.exists(self.path):
+            if inkshell.daemon_status(self.path) is not None:
+                raise IOError('a render daemon is already listening on %s' % (self.path))
+            os.remove(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # the socket is created private, chmod after bind would leave
+        # other users a moment to connect
+        umask = os.umask(0o177)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(umask)
+        listener.listen(8)
+        listener.settimeout(1)
+        for session in self.sessions:
+            session.start()
+            renderer = threading.Thread(target=self.render, args=(session,))
+            renderer.daemon = True
+            renderer.start()
+        try:
+            while self.running:
+                with self.lock:
+                    idle = not self.clients and not self.busy and self.jobs.empty()
+                    if idle and self.idle is not None and time.time() - self.last > self.idle:
+                        break
+                try:
+                    connection, address = listener.accept()
+                except socket.timeout:
+                    continue
+                connection.settimeout(None)
+                with self.lock:
+                    self.clients += 1
+                client = threading.Thread(target=self.serve, args=(connection,))
+                client.daemon = True
+                client.start()
+        finally:
+            self.running = False
+            listener.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            for session in self.sessions:
+                session.close()
+
+def main(args):
+    parser = optparse.OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--socket', action='store', type='string',
+        dest='socket', default=DAEMONSOCKET,
+        help='Unix socket to listen on')
+    parser.add_option('--idle', action='store', type='float',
+        dest='idle', default=600.0,
+        help='Seconds without work before exiting')
+    parser.add_option('--shells', action='store', type='int',
+        dest='shells', default=1,
+        help='Number of inkscape shells to keep running')
+    parser.add_option('--inkscape', action='store', type='string',
+        dest='inkscape', default=INKSCAPE,
+        help='Inkscape executable')
+    parser.add_option('--status', action='store_true',
+        dest='status', default=False,
+        help='Print the status of a running daemon and exit')
+    options, args = parser.parse_args(args)
+    if options.status:
+        status = inkshell.daemon_status(options.socket)
+        if status is None:
+            sys.stderr.write('no render daemon on %s\n' % (options.socket))
+            return 1
+        sys.stdout.write(json.dumps(status, sort_keys=True) + '\n')
+        return 0
+    RenderDaemon(options.socket, options.shells, options.idle, options.inkscape).run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
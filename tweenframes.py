@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+tweenframes.py
+Tool for drawing the in-between frames of simple motion. The ink and
+paint sublayers of the frames between two keyframes are filled with the
+drawing of the first keyframe moved part of the way to the second.
+It is part of the Inkscape animation extension
+
+Copyright (C) 2014 Nathan Jent <nathanjent@nathanjent.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+import sys, inkex
+sys.path.append('/usr/share/inkscape/extensions')
+from framelayers import FrameIndex
+import frametween
+
+# the sublayers tweened for each choice in the dialog
+SUBLAYERS = {'inkpaint': ('paint', 'ink'), 'ink': ('ink',), 'paint': ('paint',)}
+# a new sublayer goes below the first of these that the frame has, the
+# order importpenciltest.py creates them in
+ABOVE = {'paint': ('ink', 'frametext'), 'ink': ('frametext',)}
+
+class TweenFrames(inkex.Effect):
+    def __init__(self):
+        inkex.Effect.__init__(self)
+        self.OptionParser.add_option('--fromkey', action = 'store',
+            type = 'int', dest = 'fromkey', default = '1',
+            help = 'First keyframe #')
+        self.OptionParser.add_option('--tokey', action = 'store',
+            type = 'int', dest = 'tokey', default = '12',
+            help = 'Last keyframe #')
+        self.OptionParser.add_option('--sublayers', action = 'store',
+            type = 'string', dest = 'sublayers', default = 'inkpaint',
+            help = 'Sublayers to tween, inkpaint, ink or paint')
+        self.OptionParser.add_option('--match', action = 'store',
+            type = 'string', dest = 'match', default = 'order',
+            help = 'Match the keyframe drawings by order or name')
+        self.OptionParser.add_option('--easing', action = 'store',
+            type = 'string', dest = 'easing', default = 'linear',
+            help = 'Easing, linear, easein, easeout or easeinout')
+        self.OptionParser.add_option('--replace', action = 'store',
+            type = 'inkbool', dest = 'replace', default = 'false',
+            help = 'Replace drawings already in the in-between sublayers')
+
+    def addsublayer(self, index, framenum, frametype):
+        layer = index.get(framenum, 'f')
+        sublayer = inkex.etree.Element('g', id='%s%s' % (frametype, index.frame(framenum)))
+        sublayer.set(inkex.addNS('label', 'inkscape'), frametype)
+        sublayer.set(inkex.addNS('groupmode', 'inkscape'), 'layer')
+        for kind in ABOVE[frametype]:
+            above = index.get(framenum, kind)
+            if above is not None:
+                above.addprevious(sublayer)
+                break
+        else:
+            layer.append(sublayer)
+        index.frames[framenum][frametype] = sublayer
+        return sublayer
+
+    def effect(self):
+        fromkey = self.options.fromkey
+        tokey = self.options.tokey
+        frametypes = SUBLAYERS.get(self.options.sublayers, SUBLAYERS['inkpaint'])
+        match = self.options.match
+        easing = self.options.easing
+        replace = self.options.replace
+        if not frametween.bnumpy:
+            inkex.errormsg('numpy is needed to tween frames.')
+            return
+        if tokey - fromkey < 2:
+            inkex.errormsg('There are no frames between keyframes %d and %d.' % (fromkey, tokey))
+            return
+
+        svg = self.document.getroot()
+        index = FrameIndex(svg)
+        missing = [framenum for framenum in range(fromkey + 1, tokey)
+            if index.get(framenum, 'f') is None]
+        if missing:
+            inkex.errormsg('Frames %s are missing, create them first.' % (', '.join(
+                index.frame(framenum) for framenum in missing)))
+        framenums = [framenum for framenum in range(fromkey + 1, tokey) if framenum not in missing]
+
+        # pick the sublayers to fill and empty them before new ids are taken
+        plans = []
+        kept = []
+        for frametype in frametypes:
+            first = index.get(fromkey, frametype)
+            last = index.get(tokey, frametype)
+            if first is None or last is None:
+                inkex.errormsg('Both keyframes need a %s sublayer.' % (frametype))
+                continue
+            targets = []
+            for framenum in framenums:
+                sublayer = index.get(framenum, frametype)
+                if sublayer is None:
+                    sublayer = self.addsublayer(index, framenum, frametype)
+                elif len(sublayer) and not replace:
+                    kept.append(sublayer.get('id'))
+                    continue
+                for child in list(sublayer):
+                    sublayer.remove(child)
+                targets.append((framenum, sublayer))
+            plans.append((first, last, targets))
+        if kept:
+            inkex.errormsg('Kept the drawings in %s, check replace to tween over them.' % (
+                ', '.join(kept)))
+
+        taken = set(node.get('id') for node in svg.iter() if frametween.is_element(node))
+        firstframe = index.frame(fromkey)
+        for first, last, targets in plans:
+            if not targets:
+                continue
+            tween = frametween.Tween(first, last, match, firstframe, index.frame(tokey))
+            times = frametween.ease(easing, [(framenum - fromkey) / float(tokey - fromkey)
+                for framenum, sublayer in targets])
+            for (framenum, sublayer), children in zip(targets, tween.frames(times)):
+                frametween.rename(children, firstframe, index.frame(framenum), taken)
+                sublayer.extend(children)
+            if tween.matched < tween.count:
+                inkex.errormsg('%d of %d drawings in %s have no match in %s and are held.' % (
+                    tween.count - tween.matched, tween.count, first.get('id'), last.get('id')))
+            if tween.held:
+                inkex.errormsg('The nodes of these paths differ between the keyframes, they are held: %s' % (
+                    ', '.join(tween.held)))
+
+# Create effect instance and apply it.
+if __name__ == '__main__':
+    effect = TweenFrames()
+    effect.affect()